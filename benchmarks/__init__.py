@@ -0,0 +1,21 @@
+"""
+Benchmarks of flexknot, run with pytest-benchmark.
+
+These are kept out of the default pytest run; see the README for how to
+run them and compare against the stored baselines.
+"""
+
+from time import perf_counter
+
+X_MIN = 0
+X_MAX = 1
+
+
+def best_time(function, *args, repeat=5):
+    """Fastest of repeat calls of function(*args), in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args)
+        times.append(perf_counter() - start)
+    return min(times)
@@ -0,0 +1,52 @@
+"""Shared fixtures for the benchmarks."""
+
+import numpy as np
+import pytest
+from benchmarks import X_MAX, X_MIN
+
+
+@pytest.fixture
+def rng():
+    """Seeded generator, so that every run benchmarks the same inputs."""
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def make_theta(rng):
+    """
+    Factory for random thetas with N nodes.
+
+    make_theta(N, adaptive=False, n_samples=None) returns a single theta,
+    or a stack of n_samples thetas. Adaptive thetas use all N nodes.
+    """
+    def make_theta(N, adaptive=False, n_samples=None):
+        shape = (1 if n_samples is None else n_samples, 2 * N - 2)
+        theta = rng.uniform(-1, 1, shape)
+        theta[:, 1:-1:2] = np.sort(rng.uniform(X_MIN, X_MAX,
+                                               (shape[0], N - 2)))
+        if adaptive:
+            theta = np.hstack([np.full((shape[0], 1), N + 0.5), theta])
+        return theta[0] if n_samples is None else theta
+    return make_theta
+
+
+@pytest.fixture
+def make_data(rng):
+    """
+    Factory for (xs, ys, sigma) with n_data points.
+
+    make_data(n_data, sigma_form) where sigma_form is one of "sigma_y",
+    "sigma_ys", "sigma_x_sigma_y" or "sigma_xs_sigma_ys", following the
+    forms of sigma accepted by Likelihood.
+    """
+    def make_data(n_data, sigma_form):
+        xs = rng.uniform(X_MIN, X_MAX, n_data)
+        ys = np.sin(2 * np.pi * xs) + rng.normal(0, 0.1, n_data)
+        sigma = {
+            "sigma_y": 0.1,
+            "sigma_ys": rng.uniform(0.05, 0.15, n_data),
+            "sigma_x_sigma_y": np.array([0.01, 0.1]),
+            "sigma_xs_sigma_ys": rng.uniform(0.01, 0.1, (2, n_data)),
+        }[sigma_form]
+        return xs, ys, sigma
+    return make_data
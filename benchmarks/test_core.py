@@ -0,0 +1,73 @@
+"""Benchmark flex-knot evaluation and areas."""
+
+import numpy as np
+import pytest
+from flexknot import AdaptiveKnot, FlexKnot
+from benchmarks import X_MAX, X_MIN, best_time
+
+NS = [2, 8, 32]
+N_XS = [100, 10000]
+
+
+@pytest.mark.benchmark(group="FlexKnot")
+@pytest.mark.parametrize("n_x", N_XS)
+@pytest.mark.parametrize("N", NS)
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_flexknot(benchmark, make_theta, adaptive, N, n_x):
+    """FlexKnot or AdaptiveKnot at n_x points."""
+    flexknot = (AdaptiveKnot if adaptive else FlexKnot)(X_MIN, X_MAX)
+    x = np.linspace(X_MIN, X_MAX, n_x)
+    benchmark(flexknot, x, make_theta(N, adaptive))
+
+
+@pytest.mark.benchmark(group="FlexKnot.batch")
+@pytest.mark.parametrize("N", NS)
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_flexknot_batch(benchmark, make_theta, adaptive, N):
+    """1000 thetas at 100 points in one batch."""
+    flexknot = (AdaptiveKnot if adaptive else FlexKnot)(X_MIN, X_MAX)
+    x = np.linspace(X_MIN, X_MAX, 100)
+    benchmark(flexknot.batch, x, make_theta(N, adaptive, n_samples=1000))
+
+
+@pytest.mark.benchmark(group="FlexKnot.batch")
+@pytest.mark.parametrize("N", NS)
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_flexknot_batch_loop(benchmark, make_theta, adaptive, N):
+    """The same 1000 thetas as test_flexknot_batch, one call at a time."""
+    flexknot = (AdaptiveKnot if adaptive else FlexKnot)(X_MIN, X_MAX)
+    x = np.linspace(X_MIN, X_MAX, 100)
+    thetas = make_theta(N, adaptive, n_samples=1000)
+    benchmark(lambda: np.array([flexknot(x, theta) for theta in thetas]))
+
+
+@pytest.mark.parametrize("n_x", [100, 1000])
+@pytest.mark.parametrize("N", [10, 30])
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_flexknot_batch_beats_loop(make_theta, adaptive, N, n_x):
+    """FlexKnot.batch is no slower than calling the flex-knot in turn."""
+    flexknot = (AdaptiveKnot if adaptive else FlexKnot)(X_MIN, X_MAX)
+    x = np.linspace(X_MIN, X_MAX, n_x)
+    thetas = make_theta(N, adaptive, n_samples=2000)
+
+    def loop():
+        return np.array([flexknot(x, theta) for theta in thetas])
+
+    assert np.allclose(flexknot.batch(x, thetas), loop())
+    assert best_time(flexknot.batch, x, thetas) <= best_time(loop)
+
+
+@pytest.mark.benchmark(group="FlexKnot.area")
+@pytest.mark.parametrize("N", NS)
+def test_area(benchmark, make_theta, N):
+    """Area between two flex-knots."""
+    flexknot = FlexKnot(X_MIN, X_MAX)
+    benchmark(flexknot.area, make_theta(N), make_theta(N))
+
+
+@pytest.mark.benchmark(group="FlexKnot.area_matrix")
+@pytest.mark.parametrize("N", NS)
+def test_area_matrix(benchmark, make_theta, N):
+    """Areas between every pair of 100 flex-knots."""
+    flexknot = FlexKnot(X_MIN, X_MAX)
+    benchmark(flexknot.area_matrix, make_theta(N, n_samples=100))
@@ -0,0 +1,69 @@
+"""Benchmark both likelihood branches over the forms of sigma."""
+
+import numpy as np
+import pytest
+from flexknot import Likelihood
+from benchmarks import X_MAX, X_MIN, best_time
+
+NS = [3, 10, 30]
+N_DATA = [100, 10000]
+SIGMA_Y_FORMS = ["sigma_y", "sigma_ys"]
+SIGMA_X_FORMS = ["sigma_x_sigma_y", "sigma_xs_sigma_ys"]
+
+
+@pytest.mark.benchmark(group="Likelihood sigma_y")
+@pytest.mark.parametrize("sigma_form", SIGMA_Y_FORMS)
+@pytest.mark.parametrize("n_data", N_DATA)
+@pytest.mark.parametrize("N", NS)
+def test_y_errors(benchmark, make_data, make_theta, N, n_data, sigma_form):
+    """Likelihood with sigma_y only."""
+    likelihood = Likelihood(X_MIN, X_MAX, *make_data(n_data, sigma_form),
+                            adaptive=True)
+    benchmark(likelihood, make_theta(N, adaptive=True))
+
+
+@pytest.mark.benchmark(group="Likelihood sigma_x")
+@pytest.mark.parametrize("sigma_form", SIGMA_X_FORMS)
+@pytest.mark.parametrize("n_data", N_DATA)
+@pytest.mark.parametrize("N", NS)
+def test_xy_errors(benchmark, make_data, make_theta, N, n_data, sigma_form):
+    """Likelihood with sigma_x and sigma_y."""
+    likelihood = Likelihood(X_MIN, X_MAX, *make_data(n_data, sigma_form),
+                            adaptive=True)
+    benchmark(likelihood, make_theta(N, adaptive=True))
+
+
+@pytest.mark.benchmark(group="Likelihood.batch")
+@pytest.mark.parametrize("sigma_form", SIGMA_Y_FORMS + SIGMA_X_FORMS)
+@pytest.mark.parametrize("N", NS)
+def test_batch(benchmark, make_data, make_theta, N, sigma_form):
+    """100 thetas against 1000 data points."""
+    likelihood = Likelihood(X_MIN, X_MAX, *make_data(1000, sigma_form),
+                            adaptive=True)
+    benchmark(likelihood.batch, make_theta(N, adaptive=True, n_samples=100))
+
+
+@pytest.mark.benchmark(group="Likelihood.batch")
+@pytest.mark.parametrize("sigma_form", SIGMA_Y_FORMS + SIGMA_X_FORMS)
+@pytest.mark.parametrize("N", NS)
+def test_batch_loop(benchmark, make_data, make_theta, N, sigma_form):
+    """The same 100 thetas as test_batch, one call at a time."""
+    likelihood = Likelihood(X_MIN, X_MAX, *make_data(1000, sigma_form),
+                            adaptive=True)
+    thetas = make_theta(N, adaptive=True, n_samples=100)
+    benchmark(lambda: np.array([likelihood(theta)[0] for theta in thetas]))
+
+
+@pytest.mark.parametrize("sigma_form", SIGMA_Y_FORMS)
+@pytest.mark.parametrize("n_data", [1000, 100000])
+def test_batch_beats_loop(make_data, make_theta, n_data, sigma_form):
+    """Likelihood.batch is no slower than calling the likelihood in turn."""
+    likelihood = Likelihood(X_MIN, X_MAX, *make_data(n_data, sigma_form),
+                            adaptive=True)
+    thetas = make_theta(10, adaptive=True, n_samples=100)
+
+    def loop():
+        return np.array([likelihood(theta)[0] for theta in thetas])
+
+    assert np.allclose(likelihood.batch(thetas), loop())
+    assert best_time(likelihood.batch, thetas) <= best_time(loop)
@@ -0,0 +1,34 @@
+"""Benchmark the prior transforms."""
+
+import pytest
+from flexknot import AdaptivePrior, Prior
+from benchmarks import X_MAX, X_MIN
+
+NS = [2, 8, 32]
+
+
+def _prior(adaptive, N):
+    if adaptive:
+        return AdaptivePrior(X_MIN, X_MAX, -1, 1, 0, N)
+    return Prior(X_MIN, X_MAX, -1, 1)
+
+
+def _n_dims(adaptive, N):
+    return 2 * N - 1 if adaptive else 2 * N - 2
+
+
+@pytest.mark.benchmark(group="Prior")
+@pytest.mark.parametrize("N", NS)
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_prior(benchmark, rng, adaptive, N):
+    """Transform a single hypercube."""
+    benchmark(_prior(adaptive, N), rng.uniform(size=_n_dims(adaptive, N)))
+
+
+@pytest.mark.benchmark(group="Prior.batch")
+@pytest.mark.parametrize("N", NS)
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_prior_batch(benchmark, rng, adaptive, N):
+    """Transform 1000 hypercubes in one batch."""
+    benchmark(_prior(adaptive, N).batch,
+              rng.uniform(size=(1000, _n_dims(adaptive, N))))
@@ -0,0 +1,25 @@
+"""Benchmark the theta helpers."""
+
+import numpy as np
+import pytest
+from flexknot.utils import create_theta, get_theta_n
+
+NS = [2, 8, 32]
+
+
+@pytest.mark.benchmark(group="get_theta_n")
+@pytest.mark.parametrize("N", NS)
+def test_get_theta_n(benchmark, make_theta, N):
+    """Trim an adaptive theta with N of N_max = 32 nodes in use."""
+    theta = make_theta(max(NS), adaptive=True)
+    theta[0] = N + 0.5
+    benchmark(get_theta_n, theta)
+
+
+@pytest.mark.benchmark(group="create_theta")
+@pytest.mark.parametrize("N", NS)
+def test_create_theta(benchmark, rng, N):
+    """Interleave N - 2 x nodes and N y nodes."""
+    x_nodes = np.sort(rng.uniform(0, 1, N - 2))
+    y_nodes = rng.uniform(-1, 1, N)
+    benchmark(create_theta, x_nodes, y_nodes)
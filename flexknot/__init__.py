@@ -8,11 +8,11 @@ If I get this right, I should be able to use this to investigate w(z).
 """
 
 from flexknot.core import AdaptiveKnot, FlexKnot
-from flexknot.likelihoods import Likelihood
+from flexknot.likelihoods import JointLikelihood, Likelihood
 from flexknot.priors import AdaptivePrior, Prior
 
 __all__ = [
     "AdaptiveKnot", "FlexKnot",
-    "FlexKnotLikelihood",
-    "AdaptiveKnotPrior", "FlexKnotPrior",
+    "JointLikelihood", "Likelihood",
+    "AdaptivePrior", "Prior",
 ]
@@ -0,0 +1,113 @@
+"""Bounded least-recently-used cache of flex-knot evaluations."""
+
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Least-recently-used cache keyed on theta, with hit and miss counters.
+
+    maxsize: int
+    The greatest number of results kept. Once full, the least recently
+    used result is evicted.
+
+    Array results are stored read-only, as the same array is returned
+    on every hit. Caches are pickled empty, as the grids they are keyed on
+    do not survive the round trip.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._grids = {}
+        self._next_token = 0
+
+    def __len__(self):
+        """Number of cached results."""
+        return len(self._results)
+
+    def key(self, theta, x=None):
+        """
+        Key for theta, evaluated on the grid x.
+
+        Array grids are identified by the array object, rather than by
+        hashing their contents on every call, so modifying a grid in place
+        leaves stale results. Each grid is given a token while it is alive,
+        and its results are dropped when it is garbage collected. Other
+        grids, such as scalars, are identified by their contents.
+        """
+        theta = np.ascontiguousarray(theta, dtype=float).tobytes()
+        if x is None:
+            return theta
+        if not isinstance(x, np.ndarray):
+            x = np.asarray(x)
+            return (x.shape, x.dtype.str, x.tobytes()), theta
+        try:
+            reference, token = self._grids[id(x)]
+        except KeyError:
+            reference = None
+        if reference is None or reference() is not x:
+            token = self._next_token
+            self._next_token += 1
+            reference = weakref.ref(x, self._forget(id(x), token))
+            self._grids[id(x)] = reference, token
+        return token, theta
+
+    def _forget(self, grid, token):
+        """Callback dropping a collected grid and its results."""
+        def forget(_):
+            if token == self._grids.get(grid, (None, None))[1]:
+                del self._grids[grid]
+            for key in [key for key in self._results
+                        if isinstance(key, tuple) and token == key[0]]:
+                del self._results[key]
+        return forget
+
+    def lookup(self, key, function, *args):
+        """
+        Return the result for key, calling function(*args) on a miss.
+
+        Parameters
+        ----------
+        key : hashable
+
+        function : callable
+
+        *args
+            Passed to function.
+
+        """
+        try:
+            result = self._results[key]
+        except KeyError:
+            self.misses += 1
+            result = function(*args)
+            if isinstance(result, np.ndarray):
+                result.setflags(write=False)
+            self._results[key] = result
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+            return result
+        self.hits += 1
+        self._results.move_to_end(key)
+        return result
+
+    def __getstate__(self):
+        """Pickle only the size of the cache."""
+        return {"maxsize": self.maxsize}
+
+    def __setstate__(self, state):
+        """Rebuild an empty cache."""
+        self.__init__(state["maxsize"])
+
+    def clear(self):
+        """Empty the cache and reset the counters."""
+        self._results.clear()
+        self._grids.clear()
+        self.hits = 0
+        self.misses = 0
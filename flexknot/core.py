@@ -5,13 +5,18 @@ x and y are interleaved so that N does not need to be provided for
 a non-adaptive flex-knot.
 """
 
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-from scipy.integrate import quad
 
+from flexknot.cache import LRUCache
+from flexknot.profiling import create_stats
 from flexknot.utils import (
+    ThetaLayout,
     get_theta_n,
     get_x_nodes_from_theta,
     get_y_nodes_from_theta,
+    validate_theta,
 )
 
 
@@ -30,13 +35,39 @@ class FlexKnot:
     [y0, x1, y1, x2, y2, ..., x_(N-2), y_(N-2), y_(N-1)]
     for N nodes.
 
+    layout: flexknot.utils.ThetaLayout, optional
+    Trusted layout of theta, used to read out the nodes without
+    validating theta on each call.
+
+    cache: int, optional
+    Keep up to this many evaluations in a flexknot.cache.LRUCache, keyed
+    on theta and the x grid, available as self.cache. Array grids are
+    matched by identity, so should not be modified in place.
+
+    instrument: bool or flexknot.profiling.Stats, optional
+    Record the calls, their timings and (if adaptive) floor(N) in
+    self.stats, which may be shared with other objects.
+
+    flexknot(x, theta, out=out) writes the result into an existing array,
+    such as a row of a preallocated array of samples. For a sorted grid
+    with thousands of points per segment, the result is computed in place
+    in out, and otherwise it is allocated and copied into out.
+
     """
 
-    def __init__(self, x_min, x_max):
+    _adaptive = False
+
+    def __init__(self, x_min, x_max, layout=None, cache=None,
+                 instrument=None):
+        if layout is not None and layout.adaptive != self._adaptive:
+            raise ValueError("layout.adaptive does not match the flex-knot.")
         self.x_min = x_min
         self.x_max = x_max
+        self.layout = layout
+        self.cache = LRUCache(cache) if cache else None
+        self.stats = create_stats(instrument)
 
-    def __call__(self, x, theta):
+    def __call__(self, x, theta, out=None):
         """
         Flex-knot with end nodes at x_min and x_max.
 
@@ -54,16 +85,38 @@ class FlexKnot:
 
         theta : array-like
 
+        out : array-like, optional
+            Array of the same shape as x to write the result into. See
+            FlexKnot for when this saves allocating the result.
+
         Returns
         -------
         float or array-like
+            out, if given.
 
         """
+        if self.stats is not None:
+            if self._adaptive:
+                self.stats.count_nodes(theta[0])
+            return self.stats.time("flexknot", self._lookup, x, theta, out)
+        return self._lookup(x, theta, out)
+
+    def _lookup(self, x, theta, out=None):
+        """Evaluate the flex-knot, through the cache if there is one."""
+        if self.cache is not None:
+            return _into(out, self.cache.lookup(self.cache.key(theta, x),
+                                                self._evaluate, x, theta))
+        return self._evaluate(x, theta, out)
+
+    def _evaluate(self, x, theta, out=None):
+        """Evaluate the flex-knot, bypassing the cache."""
+        if self.layout is not None:
+            return self._layout_call(x, theta, out)
         if 0 == len(theta):
-            return np.full_like(x, -1)
+            return _full(x, -1, out)
         if 1 == len(theta):
-            return np.full_like(x, theta[-1])
-        return np.interp(
+            return _full(x, theta[-1], out)
+        return _interp_into(
             x,
             np.concatenate(
                 (
@@ -73,20 +126,235 @@ class FlexKnot:
                 )
             ),
             get_y_nodes_from_theta(theta, adaptive=False),
+            out,
         )
 
-    def area(self, theta0, theta1):
+    def batch(self, x, thetas):
         """
-        Area between two flex-knots.
+        Evaluate the flex-knot for a stack of thetas.
+
+        Equivalent to np.array([self(x, theta) for theta in thetas]). The
+        nodes of every theta are extracted in one vectorized pass, and
+        each row is then interpolated with np.interp, which beats any
+        vectorized search over the nodes of every row at once.
+
+        Parameters
+        ----------
+        x : array-like, shape (n_x,) or (n_samples, n_x)
+
+        thetas : array-like, shape (n_samples, n_params)
+
+        Returns
+        -------
+        array-like, shape (n_samples, n_x)
+
+        """
+        x_nodes, y_nodes = self._padded_nodes(np.atleast_2d(thetas))
+        x = np.asarray(x, dtype=float)
+        result = np.empty(np.broadcast_shapes((len(x_nodes), 1),
+                                              np.shape(x)))
+        x = np.broadcast_to(x, result.shape)
+        for i, row in enumerate(result):
+            row[:] = np.interp(x[i], x_nodes[i], y_nodes[i])
+        return result
+
+    def _padded_nodes(self, thetas):
+        """
+        Node arrays of a stack of thetas, including the end nodes.
+
+        Returns x_nodes and y_nodes, each of shape (n_samples, N).
+        Constant flex-knots are given as two nodes at x_min and x_max.
+        """
+        validate_theta(thetas[0], adaptive=False)
+        n_samples, n_params = thetas.shape
+        if n_params < 2:
+            x_nodes = np.empty((n_samples, 2))
+            y_nodes = np.empty((n_samples, 2))
+            y_nodes[:] = thetas[:, -1:] if n_params else -1
+        else:
+            n = n_params // 2 + 1
+            x_nodes = np.empty((n_samples, n))
+            y_nodes = np.empty((n_samples, n))
+            x_nodes[:, 1:-1] = thetas[:, 1:-1:2]
+            y_nodes[:, :-1] = thetas[:, 0:-1:2]
+            y_nodes[:, -1] = thetas[:, -1]
+        x_nodes[:, 0] = self.x_min
+        x_nodes[:, -1] = self.x_max
+        return x_nodes, y_nodes
+
+    def area(self, theta0, theta1, p=1):
+        """
+        Area between two flex-knots, divided by x_max - x_min.
+
+        Both flex-knots are piecewise linear, so the area is integrated
+        exactly between the merged nodes of the two, splitting segments
+        where the flex-knots cross.
 
         Parameters
         ----------
         theta0 : array-like
 
         theta1 : array-like
+
+        p : 1 or 2, default 1
+            p = 2 gives the L2 distance between the flex-knots instead,
+            sqrt(integral((f0 - f1)^2) / (x_max - x_min)).
+
+        Returns
+        -------
+        float
+
+        """
+        x_nodes0, y_nodes0 = self._nodes(theta0)
+        x_nodes1, y_nodes1 = self._nodes(theta1)
+        x = np.union1d(x_nodes0, x_nodes1)
+        d = np.interp(x, x_nodes0, y_nodes0) - np.interp(x, x_nodes1, y_nodes1)
+        integral = np.sum(_segment_integrals(np.diff(x), d[:-1], d[1:], p))
+        return (integral / (self.x_max - self.x_min)) ** (1 / p)
+
+    def area_matrix(self, thetas, p=1, condensed=False, block_size=10000,
+                    processes=None):
+        """
+        Pairwise areas between a stack of flex-knots.
+
+        Element [i, j] is self.area(thetas[i], thetas[j], p). Pairs are
+        evaluated together in blocks, which can be spread across a pool
+        of processes.
+
+        Parameters
+        ----------
+        thetas : array-like, shape (n_samples, n_params)
+
+        p : 1 or 2, default 1
+            See FlexKnot.area.
+
+        condensed : bool, default False
+            Return only the upper triangle, in the order used by
+            scipy.spatial.distance.pdist.
+
+        block_size : int, default 10000
+            Number of pairs evaluated at once, which bounds the memory used.
+
+        processes : int, optional
+            Number of worker processes. By default, everything is evaluated
+            in this process.
+
+        Returns
+        -------
+        array-like, shape (n_samples, n_samples)
+        or (n_samples * (n_samples - 1) / 2,) if condensed
+
+        """
+        thetas = np.atleast_2d(thetas)
+        x_nodes, y_nodes = self._padded_nodes(thetas)
+        n = len(thetas)
+        n_pairs = n * (n - 1) // 2
+        starts = range(0, n_pairs, block_size)
+        stops = [min(start + block_size, n_pairs) for start in starts]
+        if processes is None:
+            integrals = (
+                _block_integrals(x_nodes, y_nodes, p, start, stop)
+                for start, stop in zip(starts, stops)
+            )
+            return self._fill_areas(n, p, condensed, starts, stops,
+                                    integrals)
+        # the nodes are sent to each worker once, rather than per block
+        with ProcessPoolExecutor(
+            processes,
+            initializer=_initialise_area_worker,
+            initargs=(x_nodes, y_nodes, p),
+        ) as executor:
+            return self._fill_areas(
+                n, p, condensed, starts, stops,
+                executor.map(_area_worker, starts, stops),
+            )
+
+    def _fill_areas(self, n, p, condensed, starts, stops, integrals):
+        """Write each block of integrals into the output as areas."""
+        if condensed:
+            areas = np.empty(n * (n - 1) // 2)
+        else:
+            areas = np.zeros((n, n))
+        for start, stop, block in zip(starts, stops, integrals):
+            block /= self.x_max - self.x_min
+            if 1 != p:
+                block **= 1 / p
+            if condensed:
+                areas[start:stop] = block
+            else:
+                i, j = _pair_indices(n, start, stop)
+                areas[i, j] = block
+                areas[j, i] = block
+        return areas
+
+    def _nodes(self, theta):
+        """
+        x and y nodes of the flex-knot, including the end nodes.
+
+        Constant flex-knots are given as two nodes at x_min and x_max.
+        """
+        if self.layout is not None:
+            return self._layout_nodes(theta)
+        if len(theta) < 2:
+            y = theta[-1] if len(theta) else -1
+            return np.array([self.x_min, self.x_max]), np.array([y, y])
+        return (
+            np.concatenate(
+                (
+                    [self.x_min],
+                    get_x_nodes_from_theta(theta, adaptive=False),
+                    [self.x_max],
+                )
+            ),
+            get_y_nodes_from_theta(theta, adaptive=False),
+        )
+
+    def _theta_gradient(self, theta, x_gradient, y_gradient):
+        """
+        Gradient with respect to theta, from those with respect to _nodes.
+
+        The end x nodes are fixed, and N and any nodes unused by an
+        adaptive flex-knot have zero gradient.
         """
-        return quad(lambda x: np.abs(self(x, theta0)-self(x, theta1)),
-                    self.x_min, self.x_max)[0] / (self.x_max - self.x_min)
+        layout = self.layout
+        if layout is None:
+            if self._adaptive:
+                layout = ThetaLayout(int(theta[0]), (len(theta) + 1) // 2,
+                                     adaptive=True)
+            else:
+                n = len(theta) if len(theta) < 2 else len(theta) // 2 + 1
+                layout = ThetaLayout(n, n, adaptive=False)
+        n = layout.n(theta)
+        gradient = np.zeros(len(theta))
+        if 1 == n:
+            # both y nodes are theta[-1]
+            gradient[-1] = np.sum(y_gradient)
+        elif n > 1:
+            gradient[layout.x_index(n)] = x_gradient[1:-1]
+            gradient[layout.y_index(n)] = y_gradient
+        return gradient
+
+    def _layout_call(self, x, theta, out=None):
+        """Evaluate the flex-knot using self.layout."""
+        n = self.layout.n(theta)
+        if 0 == n:
+            return _full(x, -1, out)
+        if 1 == n:
+            return _full(x, theta[-1], out)
+        return _interp_into(x, *self._layout_nodes(theta, n), out)
+
+    def _layout_nodes(self, theta, n=None):
+        """_nodes using self.layout."""
+        if n is None:
+            n = self.layout.n(theta)
+        if n < 2:
+            y = theta[-1] if n else -1
+            return np.array([self.x_min, self.x_max]), np.array([y, y])
+        x_nodes = np.empty(n)
+        x_nodes[0] = self.x_min
+        x_nodes[1:-1] = self.layout.x_nodes(theta, n)
+        x_nodes[-1] = self.x_max
+        return x_nodes, self.layout.y_nodes(theta, n)
 
 
 class AdaptiveKnot(FlexKnot):
@@ -108,9 +376,14 @@ class AdaptiveKnot(FlexKnot):
 
     if floor(N) = 1, the flex-knot is constant at theta[-1] = y_(Nmax-1).
     if floor(N) = 0, the flex-knot is constant at -1 (cosmology!)
+
+    layout: flexknot.utils.ThetaLayout, optional
+    Trusted adaptive layout of theta.
     """
 
-    def __call__(self, x, theta):
+    _adaptive = True
+
+    def __call__(self, x, theta, out=None):
         """
         Adaptive flex-knot with end nodes at x_min and x_max.
 
@@ -132,9 +405,196 @@ class AdaptiveKnot(FlexKnot):
 
         theta : array-like
 
+        out : array-like, optional
+            Array of the same shape as x to write the result into. See
+            FlexKnot for when this saves allocating the result.
+
         Returns
         -------
         float or array-like
+            out, if given.
+
+        """
+        return super().__call__(x, theta, out)
+
+    def _evaluate(self, x, theta, out=None):
+        """Evaluate the adaptive flex-knot, bypassing the cache."""
+        if self.layout is not None:
+            return self._layout_call(x, theta, out)
+        return super()._evaluate(x, get_theta_n(theta), out)
+
+    def _nodes(self, theta):
+        """
+        x and y nodes of the flex-knot, including the end nodes.
+
+        Constant flex-knots are given as two nodes at x_min and x_max.
+        """
+        if self.layout is not None:
+            return self._layout_nodes(theta)
+        return super()._nodes(get_theta_n(theta))
 
+    def _padded_nodes(self, thetas):
         """
-        return super().__call__(x, get_theta_n(theta))
+        Node arrays of a stack of adaptive thetas, including the end nodes.
+
+        Each row is padded out to Nmax nodes. Unused interior nodes are
+        moved to (x_max, y_(Nmax-1)), so that they only form zero-width
+        segments at the end of the flex-knot.
+        """
+        validate_theta(thetas[np.argmax(thetas[:, 0])], adaptive=True)
+        n = np.floor(thetas[:, 0]).astype(int)
+        x_nodes, y_nodes = super()._padded_nodes(thetas[:, 1:])
+        y_nodes[:, -1] = thetas[:, -1]
+        unused = np.arange(x_nodes.shape[-1]) > n[:, None] - 2
+        unused[:, -1] = False
+        x_nodes[:, 1:-1][unused[:, 1:-1]] = self.x_max
+        y_nodes[:] = np.where(unused, y_nodes[:, -1:], y_nodes)
+        # w = -1 case
+        y_nodes[n == 0] = -1
+        return x_nodes, y_nodes
+
+
+def _full(x, value, out):
+    """Constant value shaped like x, written into out if given."""
+    if out is None:
+        return np.full_like(x, value)
+    out[...] = value
+    return out
+
+
+def _into(out, result):
+    """result, written into out if given."""
+    if out is None:
+        return result
+    out[...] = result
+    return out
+
+
+# points per segment above which _interp_into works in place, rather than
+# copying np.interp's result
+_IN_PLACE_POINTS_PER_SEGMENT = 2048
+
+
+def _interp_into(x, x_nodes, y_nodes, out):
+    """
+    np.interp(x, x_nodes, y_nodes), written into out if given.
+
+    For sorted one-dimensional x, such as a grid, with many points per
+    segment, each segment is computed in place in its slice of out, with
+    the same arithmetic as np.interp. Otherwise np.interp's result is
+    copied into out, which is faster for small x.
+    """
+    if out is None:
+        return np.interp(x, x_nodes, y_nodes)
+    x = np.asarray(x)
+    if (1 != x.ndim
+            or len(x) < _IN_PLACE_POINTS_PER_SEGMENT * (len(x_nodes) - 1)
+            or not np.all(x[1:] >= x[:-1])):
+        return _into(out, np.interp(x, x_nodes, y_nodes))
+    edges = np.searchsorted(x, x_nodes)
+    out[:edges[0]] = y_nodes[0]
+    out[edges[-1]:] = y_nodes[-1]
+    for k in range(len(x_nodes) - 1):
+        start, stop = edges[k], edges[k + 1]
+        if start < stop:
+            segment = out[start:stop]
+            np.subtract(x[start:stop], x_nodes[k], out=segment)
+            segment *= ((y_nodes[k + 1] - y_nodes[k])
+                        / (x_nodes[k + 1] - x_nodes[k]))
+            segment += y_nodes[k]
+    return out
+
+
+def _interp_rows(x, x_nodes, y_nodes):
+    """
+    Row-wise np.interp(x, x_nodes[i], y_nodes[i]).
+
+    x may be shared between rows, or have one row per row of the nodes.
+    Zero-width segments contribute their left-hand y node. Only suited to
+    a few nodes and points per row, such as the merged nodes of pairs of
+    flex-knots; otherwise call np.interp on each row.
+    """
+    x = np.clip(np.asarray(x, dtype=float), x_nodes[:, :1], x_nodes[:, -1:])
+    index = np.zeros(x.shape, dtype=int)
+    for k in range(1, x_nodes.shape[-1] - 1):
+        index += x >= x_nodes[:, k:k+1]
+    x0 = np.take_along_axis(x_nodes, index, axis=-1)
+    y0 = np.take_along_axis(y_nodes, index, axis=-1)
+    dx = np.take_along_axis(x_nodes, index + 1, axis=-1) - x0
+    dy = np.take_along_axis(y_nodes, index + 1, axis=-1) - y0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(dx > 0, dy / dx, 0)
+    return y0 + slope * (x - x0)
+
+
+# state of each area_matrix worker process
+_worker_area = None
+
+
+def _initialise_area_worker(x_nodes, y_nodes, p):
+    """Store the padded nodes of area_matrix in the worker."""
+    global _worker_area
+    _worker_area = (x_nodes, y_nodes, p)
+
+
+def _area_worker(start, stop):
+    """Integrals for pairs start to stop of area_matrix, in a worker."""
+    x_nodes, y_nodes, p = _worker_area
+    return _block_integrals(x_nodes, y_nodes, p, start, stop)
+
+
+def _pair_indices(n, start, stop):
+    """
+    Rows and columns of elements start to stop of the upper triangle.
+
+    The upper triangle of an n x n matrix, above the diagonal, is read row
+    by row, in the order used by scipy.spatial.distance.pdist.
+    """
+    rows = np.arange(n)
+    # index of the first element of each row
+    offsets = rows * (2 * n - rows - 1) // 2
+    k = np.arange(start, stop)
+    i = np.searchsorted(offsets, k, side="right") - 1
+    return i, k - offsets[i] + i + 1
+
+
+def _block_integrals(x_nodes, y_nodes, p, start, stop):
+    """Integrals for pairs start to stop of the rows of the nodes."""
+    i, j = _pair_indices(len(x_nodes), start, stop)
+    return _pairwise_integrals(x_nodes[i], y_nodes[i], x_nodes[j],
+                               y_nodes[j], p)
+
+
+def _pairwise_integrals(x_nodes0, y_nodes0, x_nodes1, y_nodes1, p):
+    """
+    Integrals of |f0 - f1|^p for pairs of rows of padded node arrays.
+
+    Each pair is integrated exactly between its merged nodes.
+    """
+    x = np.sort(np.concatenate((x_nodes0, x_nodes1), axis=-1), axis=-1)
+    d = _interp_rows(x, x_nodes0, y_nodes0) - _interp_rows(x, x_nodes1,
+                                                           y_nodes1)
+    return np.sum(
+        _segment_integrals(np.diff(x, axis=-1), d[:, :-1], d[:, 1:], p),
+        axis=-1,
+    )
+
+
+def _segment_integrals(h, d0, d1, p):
+    """
+    Integrals of |d|^p over segments where d is linear.
+
+    d runs from d0 to d1 over a segment of width h.
+    """
+    if 1 == p:
+        a0 = np.abs(d0)
+        a1 = np.abs(d1)
+        # if d changes sign, the two triangles have area
+        # h/2 * (d0^2 + d1^2) / (|d0| + |d1|)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 0.5 * h * np.where(
+                d0 * d1 >= 0, a0 + a1, (d0**2 + d1**2) / (a0 + a1)
+            )
+    if 2 == p:
+        return h * (d0**2 + d0 * d1 + d1**2) / 3
+    raise ValueError("p must be 1 or 2.")
@@ -0,0 +1,175 @@
+"""
+Covariance matrices of correlated data, factorised once.
+
+Each covariance computes its Cholesky factor and log-determinant at
+construction, so that evaluating a likelihood only costs solves against
+the stored factors. Pass one as sigma to flexknot.Likelihood.
+"""
+
+import numpy as np
+from scipy.linalg import cholesky, solve_triangular
+
+
+class Covariance:
+    """
+    Base class for covariance matrices of n data points.
+
+    Subclasses set self.logdet and implement whiten(residuals) and
+    solve(residuals), acting along the last axis of residuals.
+    """
+
+    def __len__(self):
+        """Number of data points."""
+        raise NotImplementedError
+
+    @property
+    def normalisation(self):
+        """log of the Gaussian normalisation, -(log|2 pi C|)/2."""
+        return -0.5 * (self.logdet + len(self) * np.log(2 * np.pi))
+
+    def chi2(self, residuals):
+        """r^T C^-1 r along the last axis of residuals."""
+        return np.sum(self.whiten(residuals)**2, axis=-1)
+
+    def whiten(self, residuals):
+        """Residuals transformed to have unit covariance."""
+        raise NotImplementedError
+
+    def solve(self, residuals):
+        """C^-1 r along the last axis of residuals."""
+        raise NotImplementedError
+
+
+class DenseCovariance(Covariance):
+    """
+    Dense covariance matrix.
+
+    Each evaluation costs O(n^2).
+
+    matrix: array-like, shape (n, n)
+    """
+
+    def __init__(self, matrix):
+        self.cholesky = cholesky(np.asarray(matrix, dtype=float), lower=True)
+        self.logdet = 2 * np.sum(np.log(np.diag(self.cholesky)))
+
+    def __len__(self):
+        """Number of data points."""
+        return len(self.cholesky)
+
+    def whiten(self, residuals):
+        """L^-1 r along the last axis of residuals."""
+        return solve_triangular(self.cholesky, np.asarray(residuals).T,
+                                lower=True).T
+
+    def solve(self, residuals):
+        """C^-1 r along the last axis of residuals."""
+        return solve_triangular(self.cholesky, self.whiten(residuals).T,
+                                lower=True, trans="T").T
+
+
+class BlockDiagonalCovariance(Covariance):
+    """
+    Block-diagonal covariance matrix, such as independent spectra.
+
+    Each evaluation costs O(sum of the squared block sizes).
+
+    blocks: list of array-like, shapes (n_i, n_i)
+    The blocks in order down the diagonal, covering consecutive data
+    points.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = [DenseCovariance(block) for block in blocks]
+        self.logdet = sum(block.logdet for block in self.blocks)
+        self._slices = []
+        start = 0
+        for block in self.blocks:
+            self._slices.append(slice(start, start + len(block)))
+            start += len(block)
+
+    def __len__(self):
+        """Number of data points."""
+        return self._slices[-1].stop if self._slices else 0
+
+    def whiten(self, residuals):
+        """Residuals whitened block by block."""
+        return self._map("whiten", residuals)
+
+    def solve(self, residuals):
+        """C^-1 r along the last axis of residuals."""
+        return self._map("solve", residuals)
+
+    def _map(self, method, residuals):
+        """Apply method of each block to its slice of residuals."""
+        residuals = np.asarray(residuals, dtype=float)
+        result = np.empty_like(residuals)
+        for block, index in zip(self.blocks, self._slices):
+            result[..., index] = getattr(block, method)(residuals[..., index])
+        return result
+
+
+class DiagonalPlusLowRankCovariance(Covariance):
+    """
+    Covariance D + U U^T of a diagonal D and a rank-k U.
+
+    Such as independent noise plus k correlated systematics. Solves use
+    the Woodbury identity, through the Cholesky factor of the k x k
+    capacitance matrix I + U^T D^-1 U, so each evaluation costs O(n k).
+
+    diagonal: array-like, shape (n,)
+    The variances, D.
+    factor: array-like, shape (n, k)
+    U.
+    """
+
+    def __init__(self, diagonal, factor):
+        self.diagonal = np.asarray(diagonal, dtype=float)
+        self.factor = np.asarray(factor, dtype=float).reshape(
+            len(self.diagonal), -1
+        )
+        self._scaled_factor = self.factor / self.diagonal[:, None]
+        capacitance = (np.eye(self.factor.shape[1])
+                       + self.factor.T @ self._scaled_factor)
+        self.cholesky = cholesky(capacitance, lower=True)
+        self.logdet = (np.sum(np.log(self.diagonal))
+                       + 2 * np.sum(np.log(np.diag(self.cholesky))))
+
+    def __len__(self):
+        """Number of data points."""
+        return len(self.diagonal)
+
+    def chi2(self, residuals):
+        """r^T C^-1 r along the last axis of residuals."""
+        residuals = np.asarray(residuals, dtype=float)
+        projection = self._project(residuals)
+        return (np.sum(residuals**2 / self.diagonal, axis=-1)
+                - np.sum(projection**2, axis=-1))
+
+    def whiten(self, residuals):
+        """
+        Residuals transformed to have unit covariance.
+
+        Costs O(n^2 k), as the whitening transform is dense. Prefer chi2 and
+        solve.
+        """
+        if not hasattr(self, "_dense"):
+            self._dense = DenseCovariance(
+                np.diag(self.diagonal) + self.factor @ self.factor.T
+            )
+        return self._dense.whiten(residuals)
+
+    def solve(self, residuals):
+        """C^-1 r along the last axis of residuals."""
+        residuals = np.asarray(residuals, dtype=float)
+        projection = solve_triangular(self.cholesky,
+                                      self._project(residuals).T,
+                                      lower=True, trans="T").T
+        return (residuals / self.diagonal
+                - projection @ self._scaled_factor.T)
+
+    def _project(self, residuals):
+        """L_K^-1 U^T D^-1 r, where L_K is the capacitance's factor."""
+        return solve_triangular(self.cholesky,
+                                (residuals @ self._scaled_factor).T,
+                                lower=True).T
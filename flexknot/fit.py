@@ -0,0 +1,133 @@
+"""Maximum-likelihood flex-knots, from multiple starts drawn from a prior."""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from scipy.optimize import minimize
+
+from flexknot.priors import AdaptivePrior
+from flexknot.utils import ThetaLayout
+
+
+def maximise_likelihood(likelihood, prior, N=None, n_starts=10,
+                        processes=None, rng=None):
+    """
+    Maximum-likelihood theta for each number of nodes.
+
+    Each start is drawn from the prior and climbed with L-BFGS-B, using
+    likelihood.value_and_grad, within the prior's box. The nodes are
+    sorted by x before each evaluation, so that x nodes may pass each
+    other during the climb.
+
+    Parameters
+    ----------
+    likelihood : flexknot.Likelihood
+
+    prior : flexknot.Prior or flexknot.AdaptivePrior
+        Matching likelihood, i.e. adaptive if likelihood is.
+
+    N : int or iterable of int, optional
+        Numbers of nodes to fit. Required for a non-adaptive prior, and
+        by default every N from N_min to N_max of an adaptive prior.
+
+    n_starts : int, default 10
+        Number of starts for each N.
+
+    processes : int, optional
+        Number of worker processes to spread the starts over. By default,
+        everything is run in this process.
+
+    rng : np.random.Generator, optional
+        Used to draw the starts.
+
+    Returns
+    -------
+    dict of int N: (theta, logL)
+        The best theta found for each N, and its log-likelihood.
+
+    """
+    rng = np.random.default_rng(rng)
+    adaptive = isinstance(prior, AdaptivePrior)
+    if N is None:
+        if not adaptive:
+            raise ValueError("N is needed for a non-adaptive prior.")
+        N = range(prior.N_min, prior.N_max + 1)
+    Ns = [int(n) for n in np.atleast_1d(N)]
+
+    starts = []
+    for n in Ns:
+        if adaptive:
+            layout = ThetaLayout(n, prior.N_max, adaptive=True)
+        else:
+            layout = ThetaLayout(n, n, adaptive=False)
+        thetas = prior.batch(rng.uniform(size=(n_starts, layout.n_params)))
+        if adaptive:
+            thetas[:, 0] = n + 0.5
+        free = np.concatenate(
+            (np.arange(layout.n_params)[layout.x_index(n)],
+             layout.y_index(n))
+        ).astype(int)
+        bounds = ([(prior.x_min, prior.x_max)] * (n - 2 if n > 2 else 0)
+                  + [(prior.y_min, prior.y_max)] * len(layout.y_index(n)))
+        starts += [(n, theta, free, bounds) for theta in thetas]
+
+    if processes is None:
+        climb = partial(_climb, likelihood)
+        results = [climb(*start) for start in starts]
+    else:
+        with ProcessPoolExecutor(processes, initializer=_initialise_worker,
+                                 initargs=(likelihood,)) as executor:
+            results = list(executor.map(_worker_climb, *zip(*starts)))
+
+    best = {}
+    for n, (theta, logL) in zip((start[0] for start in starts), results):
+        if n not in best or logL > best[n][1]:
+            best[n] = (theta, logL)
+    return best
+
+
+# likelihood of each worker process
+_worker_likelihood = None
+
+
+def _initialise_worker(likelihood):
+    """Store the likelihood for the climbs in this process."""
+    global _worker_likelihood
+    _worker_likelihood = likelihood
+
+
+def _worker_climb(n, theta, free, bounds):
+    """Climb the worker's likelihood from theta."""
+    return _climb(_worker_likelihood, n, theta, free, bounds)
+
+
+def _climb(likelihood, n, theta, free, bounds):
+    """Climb likelihood from theta, varying theta[free]."""
+    # interior x nodes, and their y nodes
+    n_x = max(n - 2, 0)
+    x_index = free[:n_x]
+    y_index = free[n_x:][1:1+n_x]
+
+    def sort(v):
+        """theta with v in place, and the nodes sorted by x."""
+        theta[free] = v
+        order = np.argsort(theta[x_index], kind="stable")
+        theta[x_index] = theta[x_index][order]
+        theta[y_index] = theta[y_index][order]
+        return theta.copy(), order
+
+    def objective(v):
+        sorted_theta, order = sort(v)
+        logL, gradient = likelihood.value_and_grad(sorted_theta)
+        # gradient with respect to the unsorted nodes
+        unsorted = gradient.copy()
+        unsorted[x_index[order]] = gradient[x_index]
+        unsorted[y_index[order]] = gradient[y_index]
+        return -logL, -unsorted[free]
+
+    if len(free):
+        result = minimize(objective, theta[free], jac=True,
+                          method="L-BFGS-B", bounds=bounds)
+        theta, _ = sort(result.x)
+    return theta, likelihood(theta)[0]
@@ -0,0 +1,177 @@
+"""
+Compiled kernels for flex-knot likelihoods.
+
+These fuse the interpolation, residuals and logsumexp of the likelihoods
+into single loops over the data, which numba compiles if it is installed.
+Without numba they are plain (slow) Python, and Likelihood falls back to
+its NumPy implementation instead.
+"""
+
+from math import erf, erfc, exp, inf, log, log1p, pi, sqrt
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+
+def _jit(function):
+    """Compile function with numba, if available."""
+    if HAVE_NUMBA:
+        return numba.njit(cache=True)(function)
+    return function
+
+
+@_jit
+def interp(x, x_nodes, y_nodes):
+    """
+    np.interp(x, x_nodes, y_nodes) for a single x.
+
+    Zero-width segments contribute their left-hand y node.
+    """
+    n = len(x_nodes)
+    if x <= x_nodes[0]:
+        return y_nodes[0]
+    if x >= x_nodes[n - 1]:
+        return y_nodes[n - 1]
+    k = np.searchsorted(x_nodes, x, side="right") - 1
+    width = x_nodes[k + 1] - x_nodes[k]
+    if width <= 0:
+        return y_nodes[k]
+    slope = (y_nodes[k + 1] - y_nodes[k]) / width
+    return y_nodes[k] + slope * (x - x_nodes[k])
+
+
+@_jit
+def log_erfc(u):
+    """
+    log(erfc(u)) for u >= 0, without underflow.
+
+    Beyond u = 25, where erfc(u) < 1e-273, uses the asymptotic series
+    erfc(u) ~ exp(-u^2) / (u sqrt(pi)) (1 - 1/(2u^2) + 3/(4u^4)).
+    """
+    if u < 25:
+        return log(erfc(u))
+    u2 = u * u
+    return -u2 - log(u * sqrt(pi)) + log(1 - 0.5 / u2 + 0.75 / (u2 * u2))
+
+
+@_jit
+def log_erf_difference(u_a, u_b):
+    """
+    log(erf(u_b) - erf(u_a)) for u_b >= u_a, without cancellation.
+
+    Same-signed u_a and u_b are written as a difference of erfcs.
+    """
+    if u_b < 0:
+        u_a, u_b = -u_b, -u_a
+    if u_a <= 0:
+        difference = erf(u_b) - erf(u_a)
+        return log(difference) if difference > 0 else -inf
+    log_erfc_a = log_erfc(u_a)
+    ratio = exp(log_erfc(u_b) - log_erfc_a)
+    if ratio >= 1:
+        return -inf
+    return log_erfc_a + log1p(-ratio)
+
+
+@_jit
+def y_errors_chi2(xs, ys, var_y, x_nodes, y_nodes):
+    """
+    chi^2 of data with sigma_y only against the flex-knot.
+
+    var_y has one element per data point.
+    """
+    chi2 = 0.0
+    for i in range(len(xs)):
+        residual = ys[i] - interp(xs[i], x_nodes, y_nodes)
+        chi2 += residual * residual / var_y[i]
+    return chi2
+
+
+@_jit
+def xy_errors_logsumexp(xs, ys, sigma_x, sigma_y, x_nodes, ms, cs, window,
+                        rtol):
+    """
+    Sum over data points of the logsumexp over segments.
+
+    Fused equivalent of flexknot.likelihoods._xy_errors_logsumexp.
+    sigma_x and sigma_y have one element per data point. Segments further
+    than window * sigma_x from a point are skipped, apart from the first
+    and last, which extend to -inf and inf. Points for which the skipped
+    terms could be more than rtol of the rest use every segment.
+    """
+    total = 0.0
+    for i in range(len(xs)):
+        lse = _point_logsumexp(xs[i], ys[i], sigma_x[i], sigma_y[i],
+                               x_nodes, ms, cs, window)
+        bound = 0.0
+        if window < inf:
+            bound = _truncation_bound(xs[i], sigma_x[i], sigma_y[i], x_nodes,
+                                      window)
+        if bound > 0 and lse < log(bound / rtol):
+            lse = _point_logsumexp(xs[i], ys[i], sigma_x[i], sigma_y[i],
+                                   x_nodes, ms, cs, inf)
+        total += lse
+    return total
+
+
+@_jit
+def _truncation_bound(x, sigma_x, sigma_y, x_nodes, window):
+    """
+    Bound on the terms of one point skipped by _point_logsumexp.
+
+    Equivalent of flexknot.likelihoods._log_truncation_bound, before the
+    log.
+    """
+    reach = window * sigma_x
+    scale = sqrt(2) * sigma_x
+    left = 0.0
+    right = 0.0
+    for k in range(1, len(x_nodes) - 1):
+        if x - x_nodes[k] > reach:
+            left = erfc((x - x_nodes[k]) / scale)
+        elif x_nodes[k] - x > reach:
+            right = erfc((x_nodes[k] - x) / scale)
+            break
+    return (left + right) / sigma_y
+
+
+@_jit
+def _point_logsumexp(x, y, sigma_x, sigma_y, x_nodes, ms, cs, window):
+    """Logsumexp over the segments within window * sigma_x of one point."""
+    n_segments = len(ms)
+    var_x = sigma_x * sigma_x
+    var_y = sigma_y * sigma_y
+    reach = window * sigma_x
+    maximum = -inf
+    scaled_sum = 0.0
+    for k in range(n_segments):
+        a = x_nodes[k]
+        b = x_nodes[k + 1]
+        if k > 0 and a - x > reach:
+            break
+        if k < n_segments - 1 and x - b > reach:
+            continue
+        m = ms[k]
+        q = var_x * m * m + var_y
+        delta = y - cs[k]
+        beta = (x * var_y + delta * m * var_x) / q
+        gamma = (m * x - delta) ** 2 / 2 / q
+        t = sqrt(q / 2) / (sigma_x * sigma_y)
+        log_difference = log_erf_difference(t * (a - beta), t * (b - beta))
+        if log_difference == -inf:
+            continue
+        log_term = -gamma - 0.5 * log(q) + log_difference
+        if log_term > maximum:
+            scaled_sum = scaled_sum * exp(maximum - log_term) + 1
+            maximum = log_term
+        else:
+            scaled_sum += exp(log_term - maximum)
+    if scaled_sum > 0:
+        return maximum + log(scaled_sum)
+    return -inf
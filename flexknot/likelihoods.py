@@ -1,10 +1,16 @@
 """Likelihoods using flex-knots."""
 
-import numpy as np
-from scipy.special import erf, logsumexp
-from flexknot.utils import get_x_nodes_from_theta
+import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+from scipy.special import erf, erfc, erfcx
+from flexknot.cache import LRUCache
 from flexknot.core import AdaptiveKnot, FlexKnot
+from flexknot.covariance import Covariance
+from flexknot.profiling import create_stats
 
 
 class Likelihood:
@@ -19,12 +25,156 @@ class Likelihood:
 
     Returns likelihood(theta) -> log(L), [] where [] is the (lack of)
     derived parameters.
+
+    The data can be processed in blocks of chunk_size points, or with
+    sigma_x in blocks small enough that the temporaries fit in max_memory
+    bytes, to bound the memory used by each evaluation.
+
+    Likelihood.from_files builds a likelihood on memory-mapped .npy or raw
+    binary files, streaming over them in blocks.
+
+    Without sigma_x, sufficient_statistics=True sorts the data once and
+    evaluates chi^2 from sums over about sqrt(len(xs)) bins of it, summing
+    only the bins containing a node point by point, so that each
+    evaluation costs O(N log(len(xs)) + (N + 1) sqrt(len(xs))) rather than
+    O(len(xs)).
+
+    With sigma_x, truncate=n only pairs each data point with the segments
+    that come within n sigma_x of it, rather than with every segment.
+    The terms dropped from each point's sum over segments total at most
+    erfc(d/(sqrt(2) sigma_x)) / sigma_y on each side, where d > n sigma_x
+    is the distance to the nearest dropped node, and the retained terms
+    are q^-1/2 exp(-gamma) (erf(t+) - erf(t-)) <= 2 / sigma_y. Points
+    whose retained terms do not exceed this bound by a factor of 10^4 are
+    paired with every segment instead. These are outliers many sigma_y
+    from the flex-knot, and, for n below about 5, points within a few
+    sigma_x of a dropped node. As erfc(n/sqrt(2)) > 10^-4 for n < 3.9, n
+    should be at least 4, and n = 5 only sends points with residuals
+    beyond about 3 sigma_y next to a node to every segment.
+
+    A flexknot.utils.ThetaLayout can be passed as layout, to read the nodes
+    out of theta without validating it on each call.
+
+    backend="numba" evaluates the likelihood with the compiled kernels in
+    flexknot.kernels, falling back to NumPy if numba is not installed.
+
+    Likelihoods can be pickled, to send them to worker processes or save
+    them in checkpoints.
+
+    With sigma_x, the temporaries of each evaluation are kept in buffers
+    that are reused between calls, one set per calling thread.
+
+    cache=maxsize keeps up to maxsize results in a flexknot.cache.LRUCache
+    keyed on theta, available as self.cache.
+
+    derived_x, derived_integrals and derived_slopes request derived
+    parameters, computed from the nodes already built for log(L): the
+    flex-knot at each x in derived_x, its integral over each (a, b) in
+    derived_integrals, and its slope at each x in derived_slopes. These
+    are returned in that order in place of [], and self.n_derived counts
+    them.
+
+    instrument=True, or a flexknot.profiling.Stats to share, records the
+    calls, the time spent reading out the nodes, evaluating log(L) and
+    computing derived parameters, and (if adaptive) floor(N) in
+    self.stats.
+
+    value_and_grad(theta) returns log(L) and its exact gradient with
+    respect to theta.
+
+    For correlated errors on y, sigma can instead be a
+    flexknot.covariance.Covariance, such as a DenseCovariance,
+    BlockDiagonalCovariance or DiagonalPlusLowRankCovariance, which are
+    factorised once when they are built.
     """
 
-    def __init__(self, x_min, x_max, xs, ys, sigma, adaptive):
+    def __init__(self, x_min, x_max, xs, ys, sigma, adaptive,
+                 chunk_size=None, max_memory=None,
+                 sufficient_statistics=False, truncate=None, layout=None,
+                 backend="numpy", cache=None, derived_x=None,
+                 derived_integrals=None, derived_slopes=None,
+                 instrument=None):
+        self.cache = LRUCache(cache) if cache else None
+        self.stats = create_stats(instrument)
         self._likelihood_function = create_likelihood_function(
-            x_min, x_max, xs, ys, sigma, adaptive
+            x_min, x_max, xs, ys, sigma, adaptive,
+            chunk_size=chunk_size, max_memory=max_memory,
+            sufficient_statistics=sufficient_statistics,
+            truncate=truncate, layout=layout, backend=backend,
+            derived_x=derived_x, derived_integrals=derived_integrals,
+            derived_slopes=derived_slopes,
         )
+        self._likelihood_function.stats = self.stats
+
+    @property
+    def n_derived(self):
+        """Number of derived parameters returned with log(L)."""
+        derived = self._likelihood_function.derived
+        return 0 if derived is None else len(derived)
+
+    @classmethod
+    def from_files(cls, x_min, x_max, xs, ys, sigma, adaptive, dtype=float,
+                   chunk_size=2**20, **kwargs):
+        """
+        Likelihood for data stored in .npy or raw binary files.
+
+        The files are memory-mapped with np.load(mmap_mode="r"), or
+        np.memmap for raw files of the given dtype, so the data are never
+        read fully into memory. Evaluation streams over them in blocks of
+        chunk_size points.
+
+        Pickling the likelihood only stores the file names, so that
+        worker processes map the files themselves.
+
+        Parameters
+        ----------
+        x_min : float
+        x_max : float > x_min
+        xs : str or path-like
+        ys : str or path-like
+        sigma : float, array-like, str or path-like
+            A raw file holding twice as many values as xs is read as
+            [[sigma_xs], [sigma_ys]].
+        adaptive : bool
+        dtype : data-type, default float
+            dtype of raw binary files.
+        chunk_size : int, default 2**20
+            Number of data points processed at once.
+        **kwargs
+            Passed on to Likelihood.
+
+        Returns
+        -------
+        Likelihood
+
+        """
+        files = (x_min, x_max, xs, ys, sigma, adaptive, dtype, chunk_size,
+                 kwargs)
+        xs = _memmap(xs, dtype)
+        ys = _memmap(ys, dtype)
+        if isinstance(sigma, (str, os.PathLike)):
+            sigma = _memmap(sigma, dtype)
+            if 1 == sigma.ndim and len(sigma) == 2 * len(xs):
+                sigma = sigma.reshape(2, -1)
+        likelihood = cls(x_min, x_max, xs, ys, sigma, adaptive,
+                         chunk_size=chunk_size, **kwargs)
+        likelihood._files = files
+        return likelihood
+
+    def __getstate__(self):
+        """Only store the file names of file-backed likelihoods."""
+        if hasattr(self, "_files"):
+            return {"_files": self._files}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        """Reopen the files of file-backed likelihoods."""
+        if "_files" in state:
+            x_min, x_max, xs, ys, sigma, adaptive, dtype, chunk_size, kwargs \
+                = state["_files"]
+            state = self.from_files(x_min, x_max, xs, ys, sigma, adaptive,
+                                    dtype, chunk_size, **kwargs).__dict__
+        self.__dict__.update(state)
 
     def __call__(self, theta):
         """
@@ -46,13 +196,199 @@ class Likelihood:
 
         Returns
         -------
-        tuple(float, [])
+        tuple(float, [] or array-like of derived parameters)
 
         """
+        if self.stats is not None:
+            return self.stats.time("likelihood", self._lookup, theta)
+        return self._lookup(theta)
+
+    def _lookup(self, theta):
+        """Evaluate the likelihood, through the cache if there is one."""
+        if self.cache is not None:
+            return self.cache.lookup(self.cache.key(theta),
+                                     self._likelihood_function, theta)
         return self._likelihood_function(theta)
 
+    def value_and_grad(self, theta):
+        """
+        Log-likelihood and its gradient with respect to theta.
+
+        The gradient is exact, and computed in the same pass over the data
+        as log(L). Every x and y node in use has a gradient, while N and
+        any unused nodes of an adaptive theta have zero gradient. This
+        always uses the NumPy implementation, whatever the backend.
+
+        Parameters
+        ----------
+        theta : array-like
 
-def create_likelihood_function(x_min, x_max, xs, ys, sigma, adaptive):
+        Returns
+        -------
+        tuple(float, array-like of the same length as theta)
+
+        """
+        return self._likelihood_function.value_and_grad(theta)
+
+    def batch(self, thetas):
+        """
+        Log-likelihoods of a stack of thetas.
+
+        Equivalent to np.array([self(theta)[0] for theta in thetas]), but
+        skipping the derived parameters, and with the data prepared once
+        for the whole stack.
+
+        Parameters
+        ----------
+        thetas : array-like, shape (n_samples, n_params)
+
+        Returns
+        -------
+        array-like, shape (n_samples,)
+
+        """
+        return self._likelihood_function.batch(np.atleast_2d(thetas))
+
+
+class JointLikelihood:
+    """
+    Likelihood of several datasets described by the same flex-knot.
+
+    likelihoods: list of Likelihood
+    One per dataset, each with its own data and form of sigma, but all
+    with the same x_min, x_max and adaptive.
+    threads: int, optional
+    Number of threads to evaluate the datasets on concurrently. NumPy
+    releases the GIL in the heavy lifting, so this helps when there are
+    several large datasets. By default, they are evaluated in turn.
+
+    The nodes are read out of theta once per call, and passed to each
+    dataset's log-likelihood, rather than each dataset reading them out
+    again. The caches and instrumentation of the individual likelihoods
+    are bypassed.
+
+    Returns likelihood(theta) -> sum of log(L), derived parameters of every
+    dataset in turn.
+
+    Use as a context manager, or call close() when finished, to shut down
+    the threads.
+    """
+
+    def __init__(self, likelihoods, threads=None):
+        self._functions = [likelihood._likelihood_function
+                           for likelihood in likelihoods]
+        if not self._functions:
+            raise ValueError("Need at least one likelihood.")
+        self.flexknot = self._functions[0].flexknot
+        for function in self._functions[1:]:
+            if (function.flexknot.x_min != self.flexknot.x_min
+                    or function.flexknot.x_max != self.flexknot.x_max
+                    or function.flexknot._adaptive
+                    != self.flexknot._adaptive):
+                raise ValueError("The likelihoods must share x_min, x_max "
+                                 "and adaptive.")
+        self._executor = ThreadPoolExecutor(threads) if threads else None
+
+    @property
+    def n_derived(self):
+        """Number of derived parameters returned with log(L)."""
+        return sum(0 if function.derived is None else len(function.derived)
+                   for function in self._functions)
+
+    def __call__(self, theta):
+        """
+        Likelihood of every dataset being described by flex-knot(theta).
+
+        Parameters
+        ----------
+        theta : array-like
+
+        Returns
+        -------
+        tuple(float, [] or array-like of derived parameters)
+
+        """
+        x_nodes, y_nodes = self.flexknot._nodes(theta)
+        logL = sum(self._map(lambda function: function.loglikelihood(
+            x_nodes, y_nodes
+        )))
+        derived = [function.derived(x_nodes, y_nodes)
+                   for function in self._functions
+                   if function.derived is not None]
+        if not derived:
+            return logL, []
+        return logL, np.concatenate(derived)
+
+    def value_and_grad(self, theta):
+        """
+        Log-likelihood and its gradient with respect to theta.
+
+        Parameters
+        ----------
+        theta : array-like
+
+        Returns
+        -------
+        tuple(float, array-like of the same length as theta)
+
+        """
+        x_nodes, y_nodes = self.flexknot._nodes(theta)
+        logL, x_gradient, y_gradient = (
+            sum(terms) for terms in zip(*self._map(
+                lambda function: function.loglikelihood_and_gradient(
+                    x_nodes, y_nodes
+                )
+            ))
+        )
+        return logL, self.flexknot._theta_gradient(theta, x_gradient,
+                                                   y_gradient)
+
+    def batch(self, thetas):
+        """
+        Log-likelihoods of a stack of thetas.
+
+        Each dataset scores the whole stack at once, vectorized where its
+        likelihood allows.
+
+        Parameters
+        ----------
+        thetas : array-like, shape (n_samples, n_params)
+
+        Returns
+        -------
+        array-like, shape (n_samples,)
+
+        """
+        thetas = np.atleast_2d(thetas)
+        return sum(self._map(lambda function: function.batch(thetas)))
+
+    def _map(self, method):
+        """method(function) for each dataset, on the threads if any."""
+        if self._executor is None:
+            return [method(function) for function in self._functions]
+        return list(self._executor.map(method, self._functions))
+
+    def close(self):
+        """Shut down the threads."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        """Return self."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the threads."""
+        self.close()
+
+
+def create_likelihood_function(x_min, x_max, xs, ys, sigma, adaptive,
+                               chunk_size=None, max_memory=None,
+                               sufficient_statistics=False, truncate=None,
+                               layout=None, backend="numpy",
+                               derived_x=None, derived_integrals=None,
+                               derived_slopes=None):
     """
     Create a likelihood function for a flex-knot, for data xs, ys, sigma.
 
@@ -63,7 +399,9 @@ def create_likelihood_function(x_min, x_max, xs, ys, sigma, adaptive):
     [sigma_x, sigma_y] is assumed.)
 
     Returns likelihood(theta) -> log(L), [] where [] is the (lack of)
-    derived parameters.
+    derived parameters, unless any are requested.
+    likelihood.batch(thetas) -> array of log(L) scores a whole
+    (n_samples, n_params) stack of thetas.
 
     Parameters
     ----------
@@ -71,20 +409,68 @@ def create_likelihood_function(x_min, x_max, xs, ys, sigma, adaptive):
     x_max : float > x_min
     xs : array-like
     ys : array-like
-    sigma : float or array-like
+    sigma : float, array-like or flexknot.covariance.Covariance
     adaptive : bool
+    chunk_size : int, optional
+        Number of data points processed at once.
+    max_memory : float, optional
+        Approximate cap in bytes on the temporaries allocated per block in
+        the sigma_x case, by either the likelihood or value_and_grad. The
+        block size is reduced to fit, and is smaller for value_and_grad.
+    sufficient_statistics : bool, default False
+        In the sigma_y-only case, evaluate chi^2 from sums over bins of the
+        data sorted by x, at a cost of
+        O(N log(len(xs)) + (N + 1) sqrt(len(xs))) rather than O(len(xs)).
+    truncate : float, optional
+        In the sigma_x case, only pair each data point with the segments
+        that come within truncate * sigma_x of it. Use at least 4; see
+        Likelihood for the points that are still paired with every
+        segment.
+    layout : flexknot.utils.ThetaLayout, optional
+        Trusted layout of theta, passed on to the flex-knot.
+    backend : "numpy" or "numba", default "numpy"
+        "numba" uses the fused kernels in flexknot.kernels if numba is
+        installed, and otherwise warns and uses NumPy.
+    derived_x : array-like, optional
+        x at which to return the flex-knot as derived parameters.
+    derived_integrals : array-like, shape (n, 2), optional
+        (a, b) limits of integrals of the flex-knot to return as derived
+        parameters.
+    derived_slopes : array-like, optional
+        x at which to return the slope of the flex-knot as derived
+        parameters.
 
     Returns
     -------
-    likelihood(theta) -> log(L), []
+    likelihood(theta) -> log(L), [] or derived parameters
+        A picklable NodeLikelihood.
 
     """
-    LOG_2_SQRT_2πλ = np.log(2) + 0.5 * np.log(2 * np.pi * (x_max - x_min))
+    if backend not in ("numpy", "numba"):
+        raise ValueError("backend must be 'numpy' or 'numba'.")
+    if "numba" == backend:
+        # numba is slow to import, so only load it when asked for
+        from flexknot import kernels
+        if not kernels.HAVE_NUMBA:
+            warnings.warn("numba is not installed, using the numpy backend.")
+            backend = "numpy"
 
     if adaptive:
-        flexknot = AdaptiveKnot(x_min, x_max)
+        flexknot = AdaptiveKnot(x_min, x_max, layout=layout)
     else:
-        flexknot = FlexKnot(x_min, x_max)
+        flexknot = FlexKnot(x_min, x_max, layout=layout)
+
+    derived = None
+    if not (derived_x is None and derived_integrals is None
+            and derived_slopes is None):
+        derived = DerivedParameters(derived_x, derived_integrals,
+                                    derived_slopes)
+
+    if isinstance(sigma, Covariance):
+        if chunk_size is not None or sufficient_statistics:
+            raise ValueError("chunk_size and sufficient_statistics need "
+                             "independent errors.")
+        return CovarianceLikelihood(flexknot, xs, ys, sigma, derived=derived)
 
     # check for sigma_x
     has_sigma_x = False
@@ -95,59 +481,1042 @@ def create_likelihood_function(x_min, x_max, xs, ys, sigma, adaptive):
             has_sigma_x = True
 
     if has_sigma_x:
-        sigma_x = sigma[0]
-        sigma_y = sigma[1]
-        var_x = sigma_x**2
-        var_y = sigma_y**2
+        return XYErrorsLikelihood(
+            flexknot, xs, ys, sigma[0], sigma[1],
+            chunk_size=chunk_size, max_memory=max_memory,
+            truncate=truncate, backend=backend, derived=derived,
+        )
 
-        def xy_errors_likelihood(theta):
+    # sigma_y only
 
-            x_nodes = np.concatenate(
-                ([x_min], get_x_nodes_from_theta(theta, adaptive), [x_max])
-            )
-            # use flex-knots to get y nodes, as this is
-            # the simplest way to deal with N=0 or 1
-
-            y_nodes = flexknot(x_nodes, theta)
-
-            ms = (y_nodes[1:] - y_nodes[:-1]) / (x_nodes[1:] - x_nodes[:-1])
-            cs = y_nodes[:-1] - ms * x_nodes[:-1]
-
-            # save recalculating things
-            # indices in order [data point, relevant m and c]
-            q = (np.outer(var_x, ms**2).T + var_y).T
-            delta = np.subtract.outer(ys, cs)
-            beta = (xs * var_y + (delta * ms).T * var_x).T / q
-            gamma = (np.outer(xs, ms) - delta) ** 2 / 2 / q
-
-            t = (np.sqrt(q / 2).T / (sigma_x * sigma_y)).T
-            t_minus = t * (x_nodes[:-1] - beta)
-            t_plus = t * (x_nodes[1:] - beta)
-
-            logL = -len(xs) * LOG_2_SQRT_2πλ
-            logL += np.sum(
-                logsumexp(
-                    -gamma,
-                    b=q**-0.5 * (erf(t_plus) - erf(t_minus)),
-                    axis=-1,
-                )
-            )
+    if sufficient_statistics:
+        return SufficientStatisticsLikelihood(flexknot, xs, ys, sigma,
+                                              derived=derived)
+    return YErrorsLikelihood(flexknot, xs, ys, sigma, chunk_size=chunk_size,
+                             backend=backend, derived=derived)
+
+
+class NodeLikelihood:
+    """
+    Base class for likelihood functions of the nodes of a flex-knot.
+
+    Subclasses implement loglikelihood(x_nodes, y_nodes), where the nodes
+    include the end nodes at x_min and x_max, and
+    loglikelihood_and_gradient(x_nodes, y_nodes), which also returns the
+    gradients with respect to x_nodes and y_nodes.
+
+    Returns likelihood(theta) -> log(L), [], and
+    likelihood.batch(thetas) -> array of log(L). If derived is a
+    DerivedParameters, [] is replaced by derived(x_nodes, y_nodes).
+
+    If stats is set to a flexknot.profiling.Stats, each stage of a call is
+    timed.
+    """
+
+    def __init__(self, flexknot, derived=None):
+        self.flexknot = flexknot
+        self.derived = derived
+        self.stats = None
 
+    def __call__(self, theta):
+        """Log-likelihood of flex-knot(theta), and derived parameters."""
+        if self.stats is not None:
+            return self._instrumented_call(theta)
+        x_nodes, y_nodes = self.flexknot._nodes(theta)
+        logL = self.loglikelihood(x_nodes, y_nodes)
+        if self.derived is None:
             return logL, []
+        return logL, self.derived(x_nodes, y_nodes)
 
-        return xy_errors_likelihood
+    def _instrumented_call(self, theta):
+        """__call__, timing each stage in self.stats."""
+        stats = self.stats
+        if self.flexknot._adaptive:
+            stats.count_nodes(theta[0])
+        x_nodes, y_nodes = stats.time("nodes", self.flexknot._nodes, theta)
+        logL = stats.time("loglikelihood", self.loglikelihood,
+                          x_nodes, y_nodes)
+        if self.derived is None:
+            return logL, []
+        return logL, stats.time("derived", self.derived, x_nodes, y_nodes)
 
-    # sigma_y only
+    def batch(self, thetas):
+        """Log-likelihoods of a stack of thetas."""
+        return np.array([self(theta)[0] for theta in thetas])
+
+    def value_and_grad(self, theta):
+        """Log-likelihood of flex-knot(theta), and its gradient."""
+        x_nodes, y_nodes = self.flexknot._nodes(theta)
+        logL, x_gradient, y_gradient = self.loglikelihood_and_gradient(
+            x_nodes, y_nodes
+        )
+        return logL, self.flexknot._theta_gradient(theta, x_gradient,
+                                                   y_gradient)
+
+    def loglikelihood(self, x_nodes, y_nodes):
+        """Log-likelihood of the flex-knot with the given nodes."""
+        raise NotImplementedError
+
+    def loglikelihood_and_gradient(self, x_nodes, y_nodes):
+        """Log-likelihood, and its gradients with respect to the nodes."""
+        raise NotImplementedError
+
+
+class YErrorsLikelihood(NodeLikelihood):
+    """
+    Gaussian likelihood for data with sigma_y only.
+
+    sigma is either sigma_y or [sigma_ys]. The normalisation is computed
+    once, here. With chunk_size, the data are processed in blocks of that
+    many points, so that memory-mapped data are streamed through.
+    """
+
+    def __init__(self, flexknot, xs, ys, sigma, chunk_size=None,
+                 backend="numpy", derived=None):
+        super().__init__(flexknot, derived)
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.xs = xs
+        self.ys = ys
+        self.sigma = sigma
+        if chunk_size is None:
+            self.var_y = sigma**2
+        self.normalisation = _y_errors_normalisation(sigma, len(ys),
+                                                     chunk_size)
+        if "numba" == backend:
+            self.xs = np.asarray(xs, dtype=float)
+            self.ys = np.asarray(ys, dtype=float)
+            self.var_y = _per_point(sigma**2, xs)
+
+    def loglikelihood(self, x_nodes, y_nodes):
+        """Log-likelihood of the flex-knot with the given nodes."""
+        if "numba" == self.backend:
+            from flexknot import kernels
+            return self.normalisation - kernels.y_errors_chi2(
+                self.xs, self.ys, self.var_y, x_nodes, y_nodes
+            ) / 2
+        logL = self.normalisation
+        for block in self._blocks():
+            logL -= _y_errors_chi2(self.xs[block], self.ys[block],
+                                   self._var_y(block), x_nodes, y_nodes) / 2
+        return logL
+
+    def loglikelihood_and_gradient(self, x_nodes, y_nodes):
+        """Log-likelihood, and its gradients with respect to the nodes."""
+        ms, cs = _extended_lines(x_nodes, y_nodes)
+        logL = self.normalisation
+        dm = np.zeros(len(ms))
+        dc = np.zeros(len(ms))
+        for block in self._blocks():
+            xs = self.xs[block]
+            residuals = self.ys[block] - np.interp(xs, x_nodes, y_nodes)
+            # dlogL/dflexknot(x) at each data point
+            weights = np.broadcast_to(residuals / self._var_y(block),
+                                      np.shape(xs))
+            logL -= np.sum(weights * residuals) / 2
+            segment = np.searchsorted(x_nodes, xs, side="right")
+            dm += np.bincount(segment, weights * xs, minlength=len(ms))
+            dc += np.bincount(segment, weights, minlength=len(ms))
+        return (logL,) + _node_gradient(x_nodes, y_nodes, dm, dc)
+
+    def batch(self, thetas):
+        """
+        Log-likelihoods of a stack of thetas, without derived parameters.
+
+        Each block of data is sorted by x once, as np.interp is several
+        times faster on sorted points, and then every theta is
+        interpolated in turn, so only one row of residuals is held at once.
+        """
+        if "numba" == self.backend:
+            return super().batch(thetas)
+        nodes = [self.flexknot._nodes(theta) for theta in thetas]
+        logL = np.full(len(nodes), self.normalisation)
+        for block in self._blocks():
+            xs = self.xs[block]
+            order = np.argsort(xs)
+            xs = xs[order]
+            ys = self.ys[block][order]
+            var_y = self._var_y(block)
+            if np.ndim(var_y):
+                var_y = var_y[order]
+            for i, (x_nodes, y_nodes) in enumerate(nodes):
+                logL[i] -= _y_errors_chi2(xs, ys, var_y, x_nodes,
+                                          y_nodes) / 2
+        return logL
+
+    def _blocks(self):
+        """Slices of the data to process at once."""
+        block_size = self.chunk_size or len(self.xs)
+        return [slice(start, start + block_size)
+                for start in range(0, len(self.xs), block_size)]
 
-    var_y = sigma**2
+    def _var_y(self, block):
+        """sigma_y^2 for a block of data."""
+        if self.chunk_size is None:
+            return self.var_y
+        return _block(self.sigma, block) ** 2
 
-    def y_errors_likelihood(theta):
-        if hasattr(var_y, "__len__"):
-            logL = -0.5 * np.sum(np.log(2 * np.pi * var_y))
+
+class CovarianceLikelihood(NodeLikelihood):
+    """
+    Gaussian likelihood for data with correlated errors on y.
+
+    covariance is a flexknot.covariance.Covariance, already factorised, so
+    each evaluation only solves against its factors. This always uses
+    NumPy, whatever the backend.
+    """
+
+    def __init__(self, flexknot, xs, ys, covariance, derived=None):
+        super().__init__(flexknot, derived)
+        if len(covariance) != len(ys):
+            raise ValueError("covariance must match the number of data "
+                             "points.")
+        self.xs = xs
+        self.ys = ys
+        self.covariance = covariance
+
+    def loglikelihood(self, x_nodes, y_nodes):
+        """Log-likelihood of the flex-knot with the given nodes."""
+        residuals = self.ys - np.interp(self.xs, x_nodes, y_nodes)
+        return (self.covariance.normalisation
+                - self.covariance.chi2(residuals) / 2)
+
+    def loglikelihood_and_gradient(self, x_nodes, y_nodes):
+        """Log-likelihood, and its gradients with respect to the nodes."""
+        ms, _ = _extended_lines(x_nodes, y_nodes)
+        residuals = self.ys - np.interp(self.xs, x_nodes, y_nodes)
+        # dlogL/dflexknot(x) at each data point
+        weights = self.covariance.solve(residuals)
+        logL = self.covariance.normalisation - weights @ residuals / 2
+        segment = np.searchsorted(x_nodes, self.xs, side="right")
+        dm = np.bincount(segment, weights * self.xs, minlength=len(ms))
+        dc = np.bincount(segment, weights, minlength=len(ms))
+        return (logL,) + _node_gradient(x_nodes, y_nodes, dm, dc)
+
+    def batch(self, thetas):
+        """Log-likelihoods of a stack of thetas, in one vectorized pass."""
+        residuals = self.ys - self.flexknot.batch(self.xs, thetas)
+        return (self.covariance.normalisation
+                - self.covariance.chi2(residuals) / 2)
+
+
+class SufficientStatisticsLikelihood(NodeLikelihood):
+    """
+    Gaussian likelihood for data with sigma_y only, from sums over bins.
+
+    chi^2 against a straight line y = m x + c only depends on the weighted
+    sums of 1, x, x^2, y, xy and y^2 of the points it covers. The data are
+    sorted by x once, so that each evaluation only has to find the segment
+    boundaries with np.searchsorted.
+
+    Sums of y^2 are many times chi^2 when the signal is many sigma_y, and
+    long running sums accumulate rounding, so both are avoided. The sorted
+    data are split into about sqrt(len(xs)) bins of consecutive points,
+    and y is replaced by its residual r from a weighted least-squares line
+    through each bin, with x centred on the bin. Over a bin covered by a
+    single segment, y - (m x + c) = r + A + B x for constant A and B, so
+    chi^2 follows from the sums of 1, x, x^2, r, xr and r^2 over the bin.
+
+    Bins containing a node are summed directly instead, as there a kink in
+    the data can leave r many sigma_y even when the flex-knot fits. Each
+    evaluation costs O(N log(len(xs)) + (N + 1) sqrt(len(xs))).
+    """
+
+    def __init__(self, flexknot, xs, ys, sigma, derived=None):
+        super().__init__(flexknot, derived)
+        var_y = sigma**2
+        self.normalisation = _y_errors_normalisation(sigma, len(ys))
+
+        order = np.argsort(xs)
+        self.x_sorted = xs[order]
+        self.y_sorted = ys[order]
+        self.weights = np.ascontiguousarray(
+            np.broadcast_to(1 / var_y, np.shape(xs))[order], dtype=float
+        )
+        weights = self.weights
+
+        n_bins = int(np.ceil(np.sqrt(len(xs))))
+        self.bin_edges = np.unique(
+            np.linspace(0, len(xs), n_bins + 1).astype(int)
+        )
+        starts = self.bin_edges[:-1]
+        lengths = np.diff(self.bin_edges)
+        point_bins = np.repeat(np.arange(len(starts)), lengths)
+
+        # reference lines through the weighted mean of each bin
+        w = np.add.reduceat(weights, starts)
+        self.x_bins = np.add.reduceat(weights * self.x_sorted, starts) / w
+        self.y_bins = np.add.reduceat(weights * self.y_sorted, starts) / w
+        dx = self.x_sorted - self.x_bins[point_bins]
+        dy = self.y_sorted - self.y_bins[point_bins]
+        wxx = np.add.reduceat(weights * dx**2, starts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.slope_bins = np.where(
+                wxx > 0, np.add.reduceat(weights * dx * dy, starts) / wxx, 0
+            )
+        r = dy - self.slope_bins[point_bins] * dx
+
+        # sums over each bin of 1, x, x^2, r, xr and r^2
+        self.bin_sums = np.array([np.add.reduceat(a, starts) for a in (
+            weights, weights * dx, weights * dx**2,
+            weights * r, weights * dx * r, weights * r**2,
+        )])
+
+    def loglikelihood(self, x_nodes, y_nodes):
+        """Log-likelihood of the flex-knot with the given nodes."""
+        (w, wx, wxx, wr, wxr, wrr), A, B, _, _, points = self._pieces(
+            x_nodes, y_nodes
+        )
+        chi2 = np.sum(
+            wrr + 2 * A * wr + 2 * B * wxr
+            + A**2 * w + 2 * A * B * wx + B**2 * wxx
+        )
+        residuals = (self.y_sorted[points]
+                     - np.interp(self.x_sorted[points], x_nodes, y_nodes))
+        chi2 += np.sum(self.weights[points] * residuals**2)
+        return self.normalisation - chi2 / 2
+
+    def loglikelihood_and_gradient(self, x_nodes, y_nodes):
+        """Log-likelihood, and its gradients with respect to the nodes."""
+        (w, wx, wxx, wr, wxr, wrr), A, B, segments, bins, points = \
+            self._pieces(x_nodes, y_nodes)
+        chi2 = np.sum(
+            wrr + 2 * A * wr + 2 * B * wxr
+            + A**2 * w + 2 * A * B * wx + B**2 * wxx
+        )
+        # derivatives of -chi^2/2 with respect to each segment's line
+        d_dc = wr + A * w + B * wx
+        d_dm = wxr + A * wx + B * wxx + self.x_bins[bins] * d_dc
+        n_segments = len(x_nodes) + 1
+        dm = np.bincount(segments, d_dm, minlength=n_segments)
+        dc = np.bincount(segments, d_dc, minlength=n_segments)
+
+        xs = self.x_sorted[points]
+        residuals = self.y_sorted[points] - np.interp(xs, x_nodes, y_nodes)
+        weighted = self.weights[points] * residuals
+        chi2 += np.sum(weighted * residuals)
+        segments = np.searchsorted(x_nodes, xs, side="right")
+        dm += np.bincount(segments, weighted * xs, minlength=n_segments)
+        dc += np.bincount(segments, weighted, minlength=n_segments)
+        return ((self.normalisation - chi2 / 2,)
+                + _node_gradient(x_nodes, y_nodes, dm, dc))
+
+    def _pieces(self, x_nodes, y_nodes):
+        """
+        Sums over the bins covered by a single segment.
+
+        The first and last segments cover the data beyond the end nodes.
+
+        Returns
+        -------
+        sums : array-like, shape (6, n_bins)
+            Weighted sums of 1, x, x^2, r, xr and r^2, with x centred on
+            the bin.
+        A, B : array-like
+            The reference line minus the segment's at the bin centre, and
+            the difference of their slopes, so that the residual from the
+            segment is r + A + B x.
+        segments, bins : array-like
+            Segment and bin of each of the sums.
+        points : array-like
+            Indices of the sorted data points in the bins containing a
+            node, to be summed directly.
+
+        """
+        ms, cs = _extended_lines(x_nodes, y_nodes)
+        edges = np.searchsorted(self.x_sorted, x_nodes)
+        edge_bins = np.searchsorted(self.bin_edges, edges, side="right") - 1
+        split = np.unique(edge_bins[edges != self.bin_edges[edge_bins]])
+        bins = np.ones(len(self.bin_edges) - 1, dtype=bool)
+        bins[split] = False
+        bins = np.flatnonzero(bins)
+
+        segments = np.searchsorted(edges, self.bin_edges[bins], side="right")
+        m = ms[segments]
+        A = self.y_bins[bins] - (m * self.x_bins[bins] + cs[segments])
+        B = self.slope_bins[bins] - m
+
+        lengths = self.bin_edges[split + 1] - self.bin_edges[split]
+        points = (np.arange(np.sum(lengths))
+                  + np.repeat(self.bin_edges[split] - np.cumsum(lengths)
+                              + lengths, lengths))
+        return self.bin_sums[:, bins], A, B, segments, bins, points
+
+
+class XYErrorsLikelihood(NodeLikelihood):
+    """
+    Likelihood for data with sigma_x and sigma_y.
+
+    The true x of each data point is marginalised over
+    Uniform(x_min, x_max), segment by segment.
+
+    The data can be processed in blocks of chunk_size points, or blocks
+    small enough for the temporaries to fit in max_memory bytes. truncate
+    and backend are as described for Likelihood.
+
+    The temporaries of pairing each point with every segment are computed
+    in a _Workspace that is reused between calls. Without truncate, and
+    with the NumPy backend, it is sized at construction if the flex-knot
+    has a layout. Otherwise it grows as needed on the first calls.
+    """
+
+    def __init__(self, flexknot, xs, ys, sigma_x, sigma_y, chunk_size=None,
+                 max_memory=None, truncate=None, backend="numpy",
+                 derived=None):
+        super().__init__(flexknot, derived)
+        self.xs = xs
+        self.ys = ys
+        self.sigma_x = sigma_x
+        self.sigma_y = sigma_y
+        self.chunk_size = chunk_size
+        self.max_memory = max_memory
+        self.truncate = truncate
+        self.backend = backend
+        LOG_2_SQRT_2πλ = np.log(2) + 0.5 * np.log(
+            2 * np.pi * (flexknot.x_max - flexknot.x_min)
+        )
+        self.normalisation = -len(xs) * LOG_2_SQRT_2πλ
+        if "numba" == backend:
+            self.xs = np.asarray(xs, dtype=float)
+            self.ys = np.asarray(ys, dtype=float)
+            self.sigma_x = _per_point(sigma_x, xs)
+            self.sigma_y = _per_point(sigma_y, xs)
+        # only pairing every point with every segment fills the workspace,
+        # while truncate only uses it for the few poorly paired points
+        n_segments = 0
+        if (flexknot.layout is not None and truncate is None
+                and "numpy" == backend):
+            n_segments = max(flexknot.layout.N_max - 1, 1)
+        self.workspace = _Workspace(
+            min(self._block_size(n_segments or 1), len(xs)) * n_segments
+        )
+
+    def loglikelihood(self, x_nodes, y_nodes):
+        """Log-likelihood of the flex-knot with the given nodes."""
+        ms = (y_nodes[1:] - y_nodes[:-1]) / (x_nodes[1:] - x_nodes[:-1])
+        cs = y_nodes[:-1] - ms * x_nodes[:-1]
+
+        block_size = self._block_size(len(ms))
+        logL = self.normalisation
+        for start in range(0, len(self.xs), block_size):
+            logL += self._logsumexp(x_nodes, ms, cs,
+                                    slice(start, start + block_size))
+        return logL
+
+    def loglikelihood_and_gradient(self, x_nodes, y_nodes):
+        """Log-likelihood, and its gradients with respect to the nodes."""
+        ms = (y_nodes[1:] - y_nodes[:-1]) / (x_nodes[1:] - x_nodes[:-1])
+        cs = y_nodes[:-1] - ms * x_nodes[:-1]
+
+        block_size = self._block_size(len(ms), gradient=True)
+        logL = self.normalisation
+        gradients = np.zeros((4, len(ms)))
+        for start in range(0, len(self.xs), block_size):
+            block = slice(start, start + block_size)
+            value, block_gradients = _xy_errors_value_and_gradient(
+                x_nodes, ms, cs, self.xs[block], self.ys[block],
+                _block(self.sigma_x, block), _block(self.sigma_y, block),
+                self.truncate,
+            )
+            logL += value
+            gradients += block_gradients
+        return (logL,) + _node_gradient(x_nodes, y_nodes, *gradients)
+
+    def _block_size(self, n_segments, gradient=False):
+        """
+        Number of data points to process at once.
+
+        With the gradient, or with truncate, there are more temporaries
+        per pair of a data point and a segment.
+        """
+        if self.max_memory is None:
+            return self.chunk_size or len(self.xs)
+        if gradient:
+            bytes_per_pair = _XY_GRADIENT_BYTES_PER_PAIR
+        elif self.truncate is not None:
+            bytes_per_pair = _XY_TRUNCATED_BYTES_PER_PAIR
         else:
-            logL = -0.5 * len(ys) * np.log(2 * np.pi * var_y)
+            bytes_per_pair = _XY_BYTES_PER_PAIR
+        block_size = max(
+            1, int(self.max_memory // (bytes_per_pair * n_segments))
+        )
+        if self.chunk_size is not None:
+            block_size = min(block_size, self.chunk_size)
+        return block_size
+
+    def _logsumexp(self, x_nodes, ms, cs, block):
+        """Sum of the logsumexp over segments for a block of data."""
+        xs = self.xs[block]
+        ys = self.ys[block]
+        sigma_x = _block(self.sigma_x, block)
+        sigma_y = _block(self.sigma_y, block)
+        if "numba" == self.backend:
+            from flexknot import kernels
+            window = np.inf if self.truncate is None else self.truncate
+            return kernels.xy_errors_logsumexp(xs, ys, sigma_x, sigma_y,
+                                               x_nodes, ms, cs, window,
+                                               _TRUNCATION_RTOL)
+        if self.truncate is None:
+            return _xy_errors_logsumexp(x_nodes, ms, cs, xs, ys,
+                                        sigma_x, sigma_y, self.workspace)
+        return _xy_errors_truncated_logsumexp(x_nodes, ms, cs, xs, ys,
+                                              sigma_x, sigma_y,
+                                              self.truncate, self.workspace)
+
+
+class DerivedParameters:
+    """
+    Values, integrals and slopes of a flex-knot, computed from its nodes.
+
+    x: array-like, optional
+    Where to evaluate the flex-knot.
+    integrals: array-like, shape (n, 2), optional
+    (a, b) limits of integrals of the flex-knot.
+    slopes: array-like, optional
+    Where to take the slope of the flex-knot. This is the slope of the
+    segment to the right of each x, and zero beyond the last node.
+
+    derived(x_nodes, y_nodes) returns them concatenated in that order.
+    """
+
+    def __init__(self, x=None, integrals=None, slopes=None):
+        self.x = np.atleast_1d(np.asarray(
+            [] if x is None else x, dtype=float))
+        self.integrals = np.reshape(np.asarray(
+            [] if integrals is None else integrals, dtype=float), (-1, 2))
+        self.slopes = np.atleast_1d(np.asarray(
+            [] if slopes is None else slopes, dtype=float))
+
+    def __len__(self):
+        """Number of derived parameters."""
+        return len(self.x) + len(self.integrals) + len(self.slopes)
+
+    def __call__(self, x_nodes, y_nodes):
+        """Derived parameters of the flex-knot with the given nodes."""
+        derived = np.empty(len(self))
+        n_x = len(self.x)
+        n_integrals = len(self.integrals)
+        derived[:n_x] = np.interp(self.x, x_nodes, y_nodes)
+        if n_integrals:
+            antiderivative = _antiderivative(self.integrals, x_nodes,
+                                             y_nodes)
+            derived[n_x:n_x+n_integrals] = (antiderivative[:, 1]
+                                            - antiderivative[:, 0])
+        if len(self.slopes):
+            widths = np.diff(x_nodes)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ms = np.where(widths > 0, np.diff(y_nodes) / widths, 0)
+            # the flex-knot is constant beyond its end nodes
+            ms = np.concatenate(([0], ms, [0]))
+            derived[n_x+n_integrals:] = ms[
+                np.searchsorted(x_nodes, self.slopes, side="right")
+            ]
+        return derived
+
+
+def _antiderivative(x, x_nodes, y_nodes):
+    """
+    Integral of the flex-knot from x_nodes[0] to x.
+
+    The flex-knot is constant beyond its end nodes.
+    """
+    areas = np.diff(x_nodes) * (y_nodes[1:] + y_nodes[:-1]) / 2
+    cumulative = np.concatenate(([0], np.cumsum(areas)))
+    inside = np.clip(x, x_nodes[0], x_nodes[-1])
+    k = np.clip(np.searchsorted(x_nodes, inside, side="right") - 1,
+                0, len(x_nodes) - 2)
+    y = np.interp(inside, x_nodes, y_nodes)
+    return (cumulative[k] + (inside - x_nodes[k]) * (y_nodes[k] + y) / 2
+            + (x - inside) * y)
+
+
+def _extended_lines(x_nodes, y_nodes):
+    """
+    Slopes and intercepts of the segments of the flex-knot.
+
+    The flex-knot is constant beyond x_min and x_max, which adds a first
+    and last segment of zero slope. Zero-width segments are given zero
+    slope.
+    """
+    widths = np.diff(x_nodes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ms = np.where(widths > 0, np.diff(y_nodes) / widths, 0)
+    ms = np.concatenate(([0], ms, [0]))
+    cs = np.concatenate(
+        ([y_nodes[0]], y_nodes[:-1] - ms[1:-1] * x_nodes[:-1],
+         [y_nodes[-1]])
+    )
+    return ms, cs
+
+
+def _node_gradient(x_nodes, y_nodes, dm, dc, da=0, db=0):
+    """
+    Gradients with respect to x_nodes and y_nodes.
+
+    Chains the gradients with respect to the slope m, the intercept c and
+    the ends a and b of each segment, where m = (y1 - y0) / (x1 - x0) and
+    c = y0 - m x0. If there are two more segments than the nodes make, as
+    from _extended_lines, the first and last are the constant ends.
+    """
+    y_gradient = np.zeros(len(y_nodes))
+    if len(dm) == len(x_nodes) + 1:
+        y_gradient[0] += dc[0]
+        y_gradient[-1] += dc[-1]
+        dm = dm[1:-1]
+        dc = dc[1:-1]
+    widths = np.diff(x_nodes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse_widths = np.where(widths > 0, 1 / widths, 0)
+    ms = np.diff(y_nodes) * inverse_widths
+    # gradient with respect to m, holding y0 fixed, over the width
+    g = (dm - x_nodes[:-1] * dc) * inverse_widths
+
+    x_gradient = np.zeros(len(x_nodes))
+    y_gradient[:-1] += dc - g
+    y_gradient[1:] += g
+    x_gradient[:-1] += ms * (g - dc) + da
+    x_gradient[1:] += db - ms * g
+    return x_gradient, y_gradient
+
+
+def _y_errors_chi2(xs, ys, var_y, x_nodes, y_nodes):
+    """chi^2 of the flex-knot with the given nodes, for sigma_y only."""
+    # computed in place in the one array np.interp allocates
+    chi2 = np.interp(xs, x_nodes, y_nodes)
+    np.subtract(ys, chi2, out=chi2)
+    chi2 *= chi2
+    chi2 /= var_y
+    return np.sum(chi2)
+
+
+def _y_errors_normalisation(sigma, n, block_size=None):
+    """Gaussian normalisation of n data points with errors sigma."""
+    if not hasattr(sigma, "__len__"):
+        return -0.5 * n * np.log(2 * np.pi * sigma**2)
+    block_size = block_size or n
+    return sum(
+        -0.5 * np.sum(np.log(2 * np.pi * sigma[start:start+block_size]**2))
+        for start in range(0, n, block_size)
+    )
+
+
+# bytes of temporaries per (data point, segment) pair, for the
+# log-likelihood, with truncate, and with its gradient
+_XY_BYTES_PER_PAIR = 12 * 8
+_XY_TRUNCATED_BYTES_PER_PAIR = 24 * 8
+_XY_GRADIENT_BYTES_PER_PAIR = 34 * 8
+
+
+def _memmap(file, dtype):
+    """Memory-map a .npy or raw binary file."""
+    if str(file).endswith(".npy"):
+        return np.load(file, mmap_mode="r")
+    return np.memmap(file, dtype=dtype, mode="r")
+
+
+def _per_point(a, xs):
+    """Broadcast scalars or per-point arrays to one float per data point."""
+    return np.ascontiguousarray(np.broadcast_to(a, np.shape(xs)),
+                                dtype=float)
+
+
+def _block(a, block):
+    """Slice per-point arrays, leaving scalars alone."""
+    return a[block] if np.ndim(a) else a
+
+
+def _xy_errors_logsumexp(x_nodes, ms, cs, xs, ys, sigma_x, sigma_y,
+                         workspace=None):
+    """
+    Sum over data points of the logsumexp over segments.
+
+    This is the data-dependent part of the sigma_x, sigma_y likelihood,
+    without the normalisation.
+
+    The (data point, segment) temporaries are computed in place, in the
+    buffers of workspace if one is given.
+    """
+    if workspace is None:
+        workspace = _Workspace()
+    q, beta, gamma, t, t_minus, log_difference, tails = \
+        workspace.buffers((len(xs), len(ms)))
+    # per-point columns, against per-segment rows
+    xs = np.reshape(xs, (-1, 1))
+    var_x = np.reshape(sigma_x**2, (-1, 1))
+    var_y = np.reshape(sigma_y**2, (-1, 1))
+
+    np.multiply(var_x, ms**2, out=q)
+    q += var_y
+    # delta = y - c, held in beta until beta is needed
+    delta = np.subtract(np.reshape(ys, (-1, 1)), cs, out=beta)
+    np.multiply(xs, ms, out=gamma)
+    gamma -= delta
+    gamma *= gamma
+    gamma /= q
+    gamma /= 2
+    delta *= ms
+    delta *= var_x
+    delta += xs * var_y
+    beta /= q
+
+    np.divide(q, 2, out=t)
+    np.sqrt(t, out=t)
+    t /= np.reshape(sigma_x * sigma_y, (-1, 1))
+    np.subtract(x_nodes[:-1], beta, out=t_minus)
+    t_minus *= t
+    # t_plus, held in beta
+    t_plus = np.subtract(x_nodes[1:], beta, out=beta)
+    t_plus *= t
+
+    # log terms, held in q, leaving t free as scratch
+    log_terms = np.log(q, out=q)
+    log_terms *= -0.5
+    log_terms -= gamma
+    log_terms += _log_erf_difference_into(t_minus, t_plus, log_difference,
+                                          t, tails)
+
+    # logsumexp over the segments of each point
+    maxima = np.max(log_terms, axis=-1, keepdims=True)
+    maxima[~np.isfinite(maxima)] = 0
+    log_terms -= maxima
+    np.exp(log_terms, out=log_terms)
+    with np.errstate(divide="ignore"):
+        return np.sum(maxima[:, 0] + np.log(np.sum(log_terms, axis=-1)))
+
+
+def _xy_errors_truncated_logsumexp(x_nodes, ms, cs, xs, ys, sigma_x, sigma_y,
+                                   truncate, workspace=None):
+    """
+    _xy_errors_logsumexp, only pairing points with nearby segments.
+
+    Each data point is paired with the segments within truncate * sigma_x
+    of it. As the nodes are sorted, these are a contiguous run of
+    segments, found with np.searchsorted. The first and last segments
+    extend to -inf and inf, so that every point has at least one segment.
+
+    Points for which the dropped terms could be more than _TRUNCATION_RTOL
+    of the retained ones are paired with every segment instead, using
+    workspace if one is given.
+    """
+    lse = _xy_errors_truncated_lse(x_nodes, ms, cs, xs, ys, sigma_x, sigma_y,
+                                   truncate)
+    poor = lse < (_log_truncation_bound(x_nodes, xs, sigma_x, sigma_y,
+                                        truncate)
+                  - np.log(_TRUNCATION_RTOL))
+    if not np.any(poor):
+        return np.sum(lse)
+    return np.sum(lse[~poor]) + _xy_errors_logsumexp(
+        x_nodes, ms, cs, xs[poor], ys[poor],
+        _block(sigma_x, poor), _block(sigma_y, poor), workspace,
+    )
+
+
+def _xy_errors_truncated_lse(x_nodes, ms, cs, xs, ys, sigma_x, sigma_y,
+                             truncate):
+    """Logsumexp over the segments within truncate * sigma_x of each point."""
+    point, segment, starts = _xy_errors_pairs(x_nodes, xs,
+                                              truncate * sigma_x)
+    m = ms[segment]
+    c = cs[segment]
+    x = xs[point]
+    sigma_x = _block(sigma_x, point)
+    sigma_y = _block(sigma_y, point)
+    var_x = sigma_x**2
+    var_y = sigma_y**2
+
+    q = var_x * m**2 + var_y
+    delta = ys[point] - c
+    beta = (x * var_y + delta * m * var_x) / q
+    gamma = (m * x - delta) ** 2 / 2 / q
+
+    t = np.sqrt(q / 2) / (sigma_x * sigma_y)
+    t_minus = t * (x_nodes[:-1][segment] - beta)
+    t_plus = t * (x_nodes[1:][segment] - beta)
+
+    log_terms = (-gamma - 0.5 * np.log(q)
+                 + _log_erf_difference(t_minus, t_plus))
+
+    # logsumexp over the segments of each point
+    maxima = np.maximum.reduceat(log_terms, starts)
+    maxima[~np.isfinite(maxima)] = 0
+    with np.errstate(divide="ignore"):
+        return maxima + np.log(np.add.reduceat(
+            np.exp(log_terms - maxima[point]), starts
+        ))
+
+
+# relative accuracy of each point's sum over segments under truncation
+_TRUNCATION_RTOL = 1e-4
+
+
+def _log_truncation_bound(x_nodes, xs, sigma_x, sigma_y, truncate):
+    """
+    Log of the bound on the terms dropped by truncation, for each point.
+
+    The terms dropped on either side of a point total at most
+    erfc(d / (sqrt(2) sigma_x)) / sigma_y, where d > truncate * sigma_x is
+    the distance to the nearest node of the dropped segments on that side.
+    """
+    window = truncate * sigma_x
+    interior = x_nodes[1:-1]
+    # nodes ending the dropped segments to the left, and starting them to
+    # the right, of each point
+    left = np.searchsorted(interior, xs - window, side="left") - 1
+    right = np.searchsorted(interior, xs + window, side="right")
+    scale = np.sqrt(2) * sigma_x
+    bound = np.zeros(len(xs))
+    for dropped, nodes in [(left >= 0, left), (right < len(interior), right)]:
+        bound[dropped] += erfc(
+            np.abs(interior[nodes[dropped]] - xs[dropped])
+            / _block(scale, dropped)
+        )
+    with np.errstate(divide="ignore"):
+        return np.log(bound / sigma_y)
+
+
+def _log_erf_difference(u_a, u_b):
+    """
+    log(erf(u_b) - erf(u_a)) for u_b >= u_a, without cancellation.
+
+    If u_a and u_b have the same sign, both erfs are close to +-1 in the
+    tails, and their difference is lost to rounding. There it is instead
+    written as a difference of erfcs of positive arguments, with
+    log(erfc(u)) = log(erfcx(u)) - u^2 so that it does not underflow.
+    """
+    # erf is odd, so reflect negative pairs onto positive ones
+    negative = u_b < 0
+    lower = np.where(negative, -u_b, u_a)
+    upper = np.where(negative, -u_a, u_b)
+    tails = lower > 0
+    log_difference = np.empty(lower.shape)
+    with np.errstate(divide="ignore"):
+        log_difference[~tails] = np.log(erf(upper[~tails])
+                                        - erf(lower[~tails]))
+        lower = lower[tails]
+        upper = upper[tails]
+        log_erfc_lower = np.log(erfcx(lower)) - lower**2
+        log_erfc_upper = np.log(erfcx(upper)) - upper**2
+        log_difference[tails] = log_erfc_lower + np.log1p(
+            -np.exp(log_erfc_upper - log_erfc_lower)
+        )
+    return log_difference
+
+
+def _log_erf_difference_into(u_a, u_b, out, scratch, tails):
+    """
+    _log_erf_difference, written into out without allocating.
+
+    u_a and u_b are overwritten, and scratch and tails are float and
+    boolean scratch arrays of the same shape. Rather than indexing out
+    the tails, both forms are evaluated everywhere and then selected
+    between, as the scipy.special ufuncs cannot be given where=.
+    """
+    # erf is odd, so reflect negative pairs onto positive ones,
+    # leaving the lower end in u_a and the upper end in u_b
+    negative = np.less(u_b, 0, out=tails)
+    np.negative(u_b, out=scratch)
+    np.negative(u_a, out=u_b, where=negative)
+    np.copyto(u_a, scratch, where=negative)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        erf(u_b, out=scratch)
+        erf(u_a, out=out)
+        np.subtract(scratch, out, out=out)
+        np.log(out, out=out)
+
+        # log(erfc(u)) at both ends, using scratch for u^2
+        np.greater(u_a, 0, out=tails)
+        for u in (u_a, u_b):
+            np.square(u, out=scratch)
+            erfcx(u, out=u)
+            np.log(u, out=u)
+            u -= scratch
+        np.subtract(u_b, u_a, out=scratch)
+        np.exp(scratch, out=scratch)
+        np.negative(scratch, out=scratch)
+        np.log1p(scratch, out=scratch)
+        scratch += u_a
+    np.copyto(out, scratch, where=tails)
+    return out
+
+
+class _Workspace:
+    """
+    Reusable buffers for the (data point, segment) temporaries.
+
+    Holds the float and boolean buffers of one evaluation, grown when an
+    evaluation needs more than they hold and otherwise reused, so that
+    steady-state evaluation does not allocate them. Each thread has its
+    own buffers, so that an object holding a workspace can be evaluated
+    from several threads at once.
+
+    size: int, default 0
+    Number of elements to allocate for each thread up front, here for
+    this thread and on first use for any other.
+
+    The buffers are not pickled.
+    """
+
+    _N_FLOAT = 6
+    _N_BOOL = 1
+
+    def __init__(self, size=0):
+        self.size = size
+        self._local = threading.local()
+        if size:
+            self._allocate(size)
+
+    def _allocate(self, size):
+        """Allocate this thread's buffers, of size elements."""
+        local = self._local
+        local.size = size
+        local.floats = [np.empty(size) for _ in range(self._N_FLOAT)]
+        local.bools = [np.empty(size, dtype=bool)
+                       for _ in range(self._N_BOOL)]
+
+    def buffers(self, shape):
+        """This thread's float then boolean buffers of the given shape."""
+        size = int(np.prod(shape))
+        if size > getattr(self._local, "size", -1):
+            self._allocate(max(size, self.size))
+        local = self._local
+        return [buffer[:size].reshape(shape)
+                for buffer in local.floats + local.bools]
+
+    def __getstate__(self):
+        """Only store the size to preallocate."""
+        return {"size": self.size}
+
+    def __setstate__(self, state):
+        """Reallocate the buffers."""
+        self.__init__(state["size"])
+
+
+def _xy_errors_pairs(x_nodes, xs, window=None):
+    """
+    Flattened (data point, segment) pairs, grouped by data point.
+
+    Each point is paired with the segments within window of it, or every
+    segment if window is None. The first and last segments extend to -inf
+    and inf, so that every point has at least one segment.
+
+    Returns
+    -------
+    point, segment : array-like
+        Indices of the pairs.
+    starts : array-like
+        Index of the first pair of each data point.
+
+    """
+    if window is None:
+        first = np.zeros(len(xs), dtype=int)
+        counts = np.full(len(xs), len(x_nodes) - 1)
+    else:
+        lower = np.array(x_nodes[:-1], dtype=float)
+        lower[0] = -np.inf
+        upper = np.array(x_nodes[1:], dtype=float)
+        upper[-1] = np.inf
+        first = np.searchsorted(upper, xs - window, side="left")
+        counts = np.searchsorted(lower, xs + window, side="right") - first
+
+    starts = np.cumsum(counts) - counts
+    point = np.repeat(np.arange(len(xs)), counts)
+    segment = first[point] + np.arange(len(point)) - starts[point]
+    return point, segment, starts
+
+
+def _xy_errors_value_and_gradient(x_nodes, ms, cs, xs, ys, sigma_x, sigma_y,
+                                  truncate=None):
+    """
+    _xy_errors_logsumexp, and its gradients for each segment.
+
+    The gradient of each point's logsumexp is the softmax-weighted sum of
+    the gradients of its log terms
+    -gamma - log(q)/2 + log(erf(t (b - beta)) - erf(t (a - beta))),
+    with respect to the slope m, intercept c and ends a and b of their
+    segments.
+
+    With truncate, points that _xy_errors_truncated_logsumexp pairs with
+    every segment are treated the same way.
+
+    Returns
+    -------
+    value : float
+
+    gradients : array-like, shape (4, len(ms))
+        Gradients with respect to ms, cs, x_nodes[:-1] and x_nodes[1:].
+
+    """
+    if truncate is not None:
+        lse = _xy_errors_truncated_lse(x_nodes, ms, cs, xs, ys,
+                                       sigma_x, sigma_y, truncate)
+        poor = lse < (_log_truncation_bound(x_nodes, xs, sigma_x, sigma_y,
+                                            truncate)
+                      - np.log(_TRUNCATION_RTOL))
+        if np.any(poor):
+            value, gradients = _xy_errors_value_and_gradient(
+                x_nodes, ms, cs, xs[~poor], ys[~poor],
+                _block(sigma_x, ~poor), _block(sigma_y, ~poor), truncate,
+            )
+            poor_value, poor_gradients = _xy_errors_value_and_gradient(
+                x_nodes, ms, cs, xs[poor], ys[poor],
+                _block(sigma_x, poor), _block(sigma_y, poor),
+            )
+            return value + poor_value, gradients + poor_gradients
+    window = None if truncate is None else truncate * sigma_x
+    point, segment, starts = _xy_errors_pairs(x_nodes, xs, window)
+
+    m = ms[segment]
+    x = xs[point]
+    sigma_x = _block(sigma_x, point)
+    sigma_y = _block(sigma_y, point)
+    var_x = sigma_x**2
+    var_y = sigma_y**2
+    a = x_nodes[:-1][segment]
+    b = x_nodes[1:][segment]
+
+    q = var_x * m**2 + var_y
+    delta = ys[point] - cs[segment]
+    beta = (x * var_y + delta * m * var_x) / q
+    residual = m * x - delta
+    gamma = residual**2 / 2 / q
+    t = np.sqrt(q / 2) / (sigma_x * sigma_y)
+    u_a = t * (a - beta)
+    u_b = t * (b - beta)
+    log_difference = _log_erf_difference(u_a, u_b)
+
+    log_terms = -gamma - 0.5 * np.log(q) + log_difference
+    maxima = np.maximum.reduceat(log_terms, starts)
+    maxima[~np.isfinite(maxima)] = 0
+    with np.errstate(divide="ignore"):
+        lse = maxima + np.log(np.add.reduceat(np.exp(log_terms
+                                                     - maxima[point]),
+                                              starts))
+
+    # softmax weight of each pair within its data point
+    with np.errstate(invalid="ignore"):
+        weights = np.where(np.isfinite(lse[point]),
+                           np.exp(log_terms - lse[point]), 0)
+    # derivatives of erf over the difference, at each end
+    finite = np.isfinite(log_difference)
+    with np.errstate(invalid="ignore"):
+        phi_a = np.where(finite, 2 / np.sqrt(np.pi)
+                         * np.exp(-u_a**2 - log_difference), 0)
+        phi_b = np.where(finite, 2 / np.sqrt(np.pi)
+                         * np.exp(-u_b**2 - log_difference), 0)
 
-        logL += np.sum(-((ys - flexknot(xs, theta)) ** 2) / 2 / var_y)
-        return logL, []
+    dq_dm = 2 * var_x * m
+    dt_dm = t * var_x * m / q
+    dbeta_dm = (delta * var_x - beta * dq_dm) / q
+    dgamma_dm = (residual * x - gamma * dq_dm) / q
+    d_dm = (-dgamma_dm - var_x * m / q
+            + phi_b * (dt_dm * (b - beta) - t * dbeta_dm)
+            - phi_a * (dt_dm * (a - beta) - t * dbeta_dm))
+    d_dc = -residual / q + (phi_b - phi_a) * t * m * var_x / q
+    d_da = -phi_a * t
+    d_db = phi_b * t
 
-    return y_errors_likelihood
+    gradients = np.array([
+        np.bincount(segment, weights * d, minlength=len(ms))
+        for d in [d_dm, d_dc, d_da, d_db]
+    ])
+    return np.sum(lse), gradients
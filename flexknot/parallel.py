@@ -0,0 +1,279 @@
+"""Parallel evaluation of flex-knot likelihoods across processes."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from flexknot.covariance import Covariance
+from flexknot.likelihoods import Likelihood
+
+
+class ParallelLikelihood:
+    """
+    Likelihood evaluated for batches of thetas across a pool of processes.
+
+    Takes the same arguments as Likelihood, plus the number of worker
+    processes. xs, ys and (array) sigma are copied once into shared memory,
+    and every worker builds its Likelihood on views of the shared arrays
+    rather than receiving its own copy of the data.
+
+    Use as a context manager, or call close() when finished, to shut down
+    the workers and free the shared memory.
+    """
+
+    def __init__(self, x_min, x_max, xs, ys, sigma, adaptive, processes=None,
+                 **kwargs):
+        self._shared_memory = []
+        self._n_data = len(xs)
+        specs = [self._share(xs), self._share(ys)]
+        if np.ndim(sigma):
+            specs.append(self._share(sigma))
+        else:
+            specs.append(sigma)
+        self._processes = processes or os.cpu_count()
+        self._executor = ProcessPoolExecutor(
+            self._processes,
+            initializer=_initialise_worker,
+            initargs=(x_min, x_max, specs, adaptive, kwargs),
+        )
+
+    def _share(self, array):
+        """Copy array into shared memory, returning how to find it."""
+        array = np.asarray(array)
+        shared_memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._shared_memory.append(shared_memory)
+        np.ndarray(array.shape, array.dtype,
+                   buffer=shared_memory.buf)[...] = array
+        return _SharedArray(shared_memory.name, array.shape, array.dtype.str)
+
+    def batch(self, thetas, block_size=None, max_memory=1e8):
+        """
+        Log-likelihoods of a stack of thetas, spread across the workers.
+
+        Parameters
+        ----------
+        thetas : array-like, shape (n_samples, n_params)
+
+        block_size : int, optional
+            Number of thetas sent to a worker at once. By default, the
+            thetas are split evenly between the workers, in blocks no
+            larger than max_memory allows.
+
+        max_memory : float, default 1e8
+            Bytes of a (block_size, n_data) array of floats, which bounds
+            the temporaries of each worker for the default block_size.
+
+        Returns
+        -------
+        array-like, shape (n_samples,)
+
+        """
+        thetas = np.atleast_2d(thetas)
+        if block_size is None:
+            block_size = max(1, min(
+                -(-len(thetas) // self._processes),
+                int(max_memory // (8 * max(self._n_data, 1))),
+            ))
+        n_blocks = -(-len(thetas) // block_size)
+        blocks = np.array_split(thetas, max(n_blocks, 1))
+        return np.concatenate(
+            list(self._executor.map(_worker_batch, blocks))
+        )
+
+    def close(self):
+        """Shut down the workers and free the shared memory."""
+        self._executor.shutdown()
+        for shared_memory in self._shared_memory:
+            shared_memory.close()
+            shared_memory.unlink()
+        self._shared_memory = []
+
+    def __enter__(self):
+        """Return self."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the pool."""
+        self.close()
+
+
+class ShardedLikelihood:
+    """
+    Likelihood with the data split into shards across worker processes.
+
+    Takes the same arguments as Likelihood, plus the number of shards.
+    Each worker holds a Likelihood of its own shard of the data, including
+    its share of the normalisation, and scores every theta against it.
+    The partial log-likelihoods are summed, which cuts the latency of
+    a single evaluation when the dataset is large.
+
+    The errors must be independent between data points, so sigma cannot
+    be a flexknot.covariance.Covariance.
+
+    Use as a context manager, or call close() when finished, to shut down
+    the workers.
+    """
+
+    def __init__(self, x_min, x_max, xs, ys, sigma, adaptive, n_shards=None,
+                 **kwargs):
+        if isinstance(sigma, Covariance):
+            raise ValueError("Correlated data cannot be split into shards.")
+        n_shards = n_shards or os.cpu_count()
+        sigma_shape = np.shape(sigma)
+        self._connections = []
+        self._processes = []
+        for index in np.array_split(np.arange(len(xs)), n_shards):
+            if 2 == len(sigma_shape):
+                sigma_shard = sigma[:, index]
+            elif 1 == len(sigma_shape) and 2 != sigma_shape[0]:
+                if len(index) < 3:
+                    # two sigma_ys would be read as [sigma_x, sigma_y]
+                    raise ValueError("Each shard needs at least three data "
+                                     "points with per-point sigma_y.")
+                sigma_shard = sigma[index]
+            else:
+                sigma_shard = sigma
+            connection, worker_connection = Pipe()
+            process = Process(
+                target=_shard_worker,
+                args=(worker_connection,
+                      (x_min, x_max, xs[index], ys[index], sigma_shard,
+                       adaptive),
+                      kwargs),
+                daemon=True,
+            )
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def __call__(self, theta):
+        """
+        Likelihood of the data being described by flex-knot(theta).
+
+        Returns
+        -------
+        tuple(float, [] or array-like of derived parameters)
+
+        """
+        results = self._gather(theta)
+        # every shard shares the flex-knot, and so the derived parameters
+        return sum(logL for logL, _ in results), results[0][1]
+
+    def batch(self, thetas):
+        """
+        Log-likelihoods of a stack of thetas.
+
+        Parameters
+        ----------
+        thetas : array-like, shape (n_samples, n_params)
+
+        Returns
+        -------
+        array-like, shape (n_samples,)
+
+        """
+        return self._reduce(np.atleast_2d(thetas))
+
+    def _reduce(self, theta):
+        """Send theta to every shard, and sum the results."""
+        return sum(self._gather(theta))
+
+    def _gather(self, theta):
+        """
+        Send theta to every shard, and collect their results.
+
+        Every shard's reply is received before re-raising the first
+        exception from a worker, so that the next call starts in step.
+        """
+        for connection in self._connections:
+            connection.send(theta)
+        results = [connection.recv() for connection in self._connections]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def close(self):
+        """Shut down the workers, including any that have died."""
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        """Return self."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the workers."""
+        self.close()
+
+
+class _SharedArray:
+    """Name, shape and dtype of an array in shared memory."""
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+# state of each worker process
+_worker_shared_memory = []
+_worker_likelihood = None
+
+
+def _initialise_worker(x_min, x_max, specs, adaptive, kwargs):
+    """Build the worker's Likelihood on the shared arrays."""
+    global _worker_likelihood
+    arrays = []
+    for spec in specs:
+        if isinstance(spec, _SharedArray):
+            shared_memory = SharedMemory(name=spec.name)
+            # keep a reference, so the buffer outlives this function
+            _worker_shared_memory.append(shared_memory)
+            spec = np.ndarray(spec.shape, spec.dtype,
+                              buffer=shared_memory.buf)
+        arrays.append(spec)
+    _worker_likelihood = Likelihood(x_min, x_max, *arrays, adaptive,
+                                    **kwargs)
+
+
+def _worker_batch(thetas):
+    """Log-likelihoods of a block of thetas, in a worker."""
+    return _worker_likelihood.batch(thetas)
+
+
+def _shard_worker(connection, args, kwargs):
+    """
+    Score thetas received on connection against one shard of data.
+
+    Exceptions are sent back in place of a result, rather than ending the
+    worker.
+    """
+    try:
+        likelihood = Likelihood(*args, **kwargs)
+    except Exception as error:
+        likelihood = error
+    while True:
+        theta = connection.recv()
+        if theta is None:
+            break
+        try:
+            if isinstance(likelihood, Exception):
+                raise likelihood
+            if 2 == np.ndim(theta):
+                connection.send(likelihood.batch(theta))
+            else:
+                connection.send(likelihood(theta))
+        except Exception as error:
+            connection.send(error)
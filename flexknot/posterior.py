@@ -0,0 +1,153 @@
+"""
+Streaming summaries of flex-knot posteriors on a grid.
+
+Weighted posterior samples are evaluated in chunks, and only a weighted
+histogram per grid point is kept, so memory does not grow with the number
+of samples.
+"""
+
+from itertools import islice
+
+import numpy as np
+
+
+class FunctionalPosterior:
+    """
+    Weighted histograms of flex-knot(x, theta) at each point of a grid.
+
+    flexknot: FlexKnot or AdaptiveKnot
+    x: array-like
+    The grid.
+    y_min, y_max: float
+    Range of the histograms. Values outside it are counted in the first or
+    last bin, and their total weight is kept in self.outside.
+    bins: int
+    Number of histogram bins. Quantiles are accurate to about
+    (y_max - y_min) / bins.
+    """
+
+    def __init__(self, flexknot, x, y_min, y_max, bins=1000):
+        self.flexknot = flexknot
+        self.x = np.asarray(x, dtype=float)
+        self.edges = np.linspace(y_min, y_max, bins + 1)
+        self.histograms = np.zeros((len(self.x), bins))
+        self.total_weight = 0.0
+        self.outside = np.zeros(len(self.x))
+        self._sum = np.zeros(len(self.x))
+        self._sum_squares = np.zeros(len(self.x))
+
+    def update(self, thetas, weights=None):
+        """
+        Add a chunk of weighted samples.
+
+        Parameters
+        ----------
+        thetas : array-like, shape (n_samples, n_params)
+
+        weights : array-like, shape (n_samples,), optional
+            Defaults to equal weights.
+
+        """
+        thetas = np.atleast_2d(thetas)
+        if weights is None:
+            weights = np.ones(len(thetas))
+        weights = np.broadcast_to(
+            np.asarray(weights, dtype=float)[:, None],
+            (len(thetas), len(self.x)),
+        )
+        f = self.flexknot.batch(self.x, thetas)
+        bins = self.histograms.shape[-1]
+        index = np.floor(
+            (f - self.edges[0]) / (self.edges[-1] - self.edges[0]) * bins
+        ).astype(int)
+        outside = (index < 0) | (index >= bins)
+        np.clip(index, 0, bins - 1, out=index)
+
+        # flatten (grid point, bin) to accumulate with bincount
+        index += np.arange(len(self.x)) * bins
+        self.histograms += np.bincount(
+            index.ravel(), weights.ravel(), minlength=self.histograms.size
+        ).reshape(self.histograms.shape)
+        self.outside += np.sum(weights * outside, axis=0)
+        self.total_weight += np.sum(weights[:, 0])
+        self._sum += np.sum(weights * f, axis=0)
+        self._sum_squares += np.sum(weights * f**2, axis=0)
+
+    def quantiles(self, q):
+        """
+        Weighted quantiles at each grid point.
+
+        Interpolates linearly within the histogram bins.
+
+        Parameters
+        ----------
+        q : float or array-like
+            Quantiles between 0 and 1.
+
+        Returns
+        -------
+        array-like, shape (len(q), len(x)) or (len(x),) for a single q.
+
+        """
+        q = np.asarray(q, dtype=float)
+        cdf = np.zeros((len(self.x), len(self.edges)))
+        np.cumsum(self.histograms, axis=-1, out=cdf[:, 1:])
+        result = np.empty(q.shape + (len(self.x),))
+        for i, target in np.ndenumerate(q * self.total_weight):
+            upper = np.clip(np.sum(cdf < target, axis=-1, keepdims=True),
+                            1, len(self.edges) - 1)
+            cdf_lower = np.take_along_axis(cdf, upper - 1, axis=-1)
+            cdf_upper = np.take_along_axis(cdf, upper, axis=-1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fraction = np.where(cdf_upper > cdf_lower,
+                                    (target - cdf_lower)
+                                    / (cdf_upper - cdf_lower), 0)
+            result[i] = (self.edges[upper - 1]
+                         + fraction * np.diff(self.edges)[upper - 1])[:, 0]
+        return result
+
+    def mean(self):
+        """Weighted mean at each grid point."""
+        return self._sum / self.total_weight
+
+    def std(self):
+        """Weighted standard deviation at each grid point."""
+        variance = self._sum_squares / self.total_weight - self.mean()**2
+        return np.sqrt(np.maximum(variance, 0))
+
+
+def functional_posterior(flexknot, x, samples, y_min, y_max, bins=1000,
+                         chunk_size=1000):
+    """
+    Stream weighted samples through a FunctionalPosterior.
+
+    Parameters
+    ----------
+    flexknot : FlexKnot or AdaptiveKnot
+
+    x : array-like
+        The grid.
+
+    samples : iterable of (theta, weight)
+
+    y_min, y_max : float
+        Range of the histograms.
+
+    bins : int, default 1000
+
+    chunk_size : int, default 1000
+        Number of samples evaluated at once.
+
+    Returns
+    -------
+    FunctionalPosterior
+
+    """
+    posterior = FunctionalPosterior(flexknot, x, y_min, y_max, bins)
+    samples = iter(samples)
+    while True:
+        chunk = list(islice(samples, chunk_size))
+        if not chunk:
+            return posterior
+        thetas, weights = zip(*chunk)
+        posterior.update(np.array(thetas), np.array(weights))
@@ -7,18 +7,77 @@ goes on to make a flex-knots work.
 Currently going for interleaving x_nodes and y_nodes.
 """
 import numpy as np
-from pypolychord.priors import UniformPrior, SortedUniformPrior
+from flexknot.profiling import create_stats
 from flexknot.utils import (
+    ThetaLayout,
     create_theta,
     get_x_nodes_from_theta,
     get_y_nodes_from_theta,
 )
 
 
+class UniformPrior:
+    """
+    Uniform prior from a to b.
+
+    a: float
+    b: float > a
+    """
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+    def __call__(self, hypercube):
+        """Transform Uniform(0, 1) to Uniform(a, b)."""
+        return self.a + (self.b - self.a) * np.asarray(hypercube)
+
+
+class SortedUniformPrior(UniformPrior):
+    """
+    Sorted uniform prior from a to b.
+
+    Uses the forced identifiability transform, as pypolychord's
+    SortedUniformPrior does, so that the results are sorted in ascending
+    order.
+    """
+
+    def __call__(self, hypercube):
+        """Transform Uniform(0, 1) to sorted Uniform(a, b)."""
+        hypercube = np.asarray(hypercube, dtype=float)
+        return super().__call__(
+            _sorted_uniform_transform(hypercube[None], len(hypercube))[0]
+        )
+
+
 class Prior(UniformPrior):
-    """Interleaved uniform and sorted uniform priors for a flex-knot."""
+    """
+    Interleaved uniform and sorted uniform priors for a flex-knot.
+
+    x_min, x_max, y_min, y_max: float
+    Bounds of the x and y nodes, kept as attributes of the same names.
+
+    layout: flexknot.utils.ThetaLayout, optional
+    Trusted layout of theta, used to read out the nodes without
+    validating the hypercube on each call.
 
-    def __init__(self, x_min, x_max, y_min, y_max):
+    instrument: bool or flexknot.profiling.Stats, optional
+    Record the calls and their timings in self.stats, which may be shared
+    with other objects.
+    """
+
+    _adaptive = False
+
+    def __init__(self, x_min, x_max, y_min, y_max, layout=None,
+                 instrument=None):
+        if layout is not None and layout.adaptive != self._adaptive:
+            raise ValueError("layout.adaptive does not match the prior.")
+        self.layout = layout
+        self.stats = create_stats(instrument)
+        self.x_min = x_min
+        self.x_max = x_max
+        self.y_min = y_min
+        self.y_max = y_max
         self._x_prior = SortedUniformPrior(x_min, x_max)
         self._y_prior = UniformPrior(y_min, y_max)
 
@@ -39,6 +98,15 @@ class Prior(UniformPrior):
         and Uniform(y_min, y_max).
 
         """
+        if self.stats is not None:
+            return self.stats.time("prior", self._transform, hypercube)
+        return self._transform(hypercube)
+
+    def _transform(self, hypercube):
+        """Transform hypercube into theta."""
+        if self.layout is not None:
+            return self._layout_transform(hypercube,
+                                          np.empty(len(hypercube)))
         if len(hypercube) > 2:
             _x_prior = self._x_prior(get_x_nodes_from_theta(hypercube,
                                                             adaptive=False))
@@ -49,32 +117,77 @@ class Prior(UniformPrior):
             self._y_prior(get_y_nodes_from_theta(hypercube, adaptive=False)),
         )
 
+    def batch(self, hypercubes):
+        """
+        Prior for a stack of hypercubes, transformed in one vectorized pass.
+
+        Parameters
+        ----------
+        hypercubes : array-like, shape (n_points, n_dims)
+
+        Returns
+        -------
+        thetas : array-like, shape (n_points, n_dims)
+
+        """
+        hypercubes = np.atleast_2d(hypercubes)
+        n_dims = hypercubes.shape[-1]
+        n = n_dims if n_dims < 2 else n_dims // 2 + 1
+        layout = self.layout or ThetaLayout(n, n, adaptive=False)
+        return self._batch_transform(hypercubes, np.empty(hypercubes.shape),
+                                     layout, n - 2)
+
+    def _batch_transform(self, hypercubes, thetas, layout, n_x_nodes):
+        """
+        Transform the x and y nodes of each row into thetas.
+
+        The first n_x_nodes x nodes of each row are sorted uniform, and any
+        others are uniform.
+        """
+        x_index = layout.x_index()
+        y_index = layout.y_index()
+        thetas[:, x_index] = self.x_min + (self.x_max - self.x_min) * (
+            _sorted_uniform_transform(hypercubes[:, x_index], n_x_nodes)
+        )
+        thetas[:, y_index] = self._y_prior(hypercubes[:, y_index])
+        return thetas
+
+    def _layout_transform(self, hypercube, theta):
+        """Transform the x and y nodes into theta using self.layout."""
+        x_index = self.layout.x_index()
+        y_index = self.layout.y_index()
+        if self.layout.N_max > 2:
+            theta[x_index] = self._x_prior(hypercube[x_index])
+        theta[y_index] = self._y_prior(hypercube[y_index])
+        return theta
+
 
 class AdaptivePrior(Prior):
     """
     Interleaved uniform and sorted uniform priors appropriate for a flex-knot.
 
-    N_max: int
-    The maximum number of nodes to use with an adaptive flex-knot.
+    N_min, N_max: int
+    The minimum and maximum numbers of nodes to use with an adaptive
+    flex-knot, kept as attributes of the same names.
+
+    layout: flexknot.utils.ThetaLayout, optional
+    Trusted adaptive layout of theta.
+
+    instrument: bool or flexknot.profiling.Stats, optional
+    As for Prior.
     """
 
-    def __init__(self, x_min, x_max, y_min, y_max, N_min, N_max):
+    _adaptive = True
+
+    def __init__(self, x_min, x_max, y_min, y_max, N_min, N_max,
+                 layout=None, instrument=None):
+        self.N_min = N_min
+        self.N_max = N_max
         self._N_prior = UniformPrior(N_min, N_max + 1)
-        super().__init__(x_min, x_max, y_min, y_max)
-
-        # redefine self._x_prior
-        self.__used_x_prior = self._x_prior
-        self.__unused_x_prior = UniformPrior(x_min, x_max)
-        self._x_prior = (
-            lambda hypercube_x: np.concatenate(
-                (
-                    self.__used_x_prior(hypercube_x[: self.__n_x_nodes]),
-                    self.__unused_x_prior(hypercube_x[self.__n_x_nodes:]),
-                )
-            )
-            if self.__n_x_nodes > 0
-            else self.__unused_x_prior(hypercube_x)
-        )
+        super().__init__(x_min, x_max, y_min, y_max, layout=layout,
+                         instrument=instrument)
+        self._adaptive_layout = layout or ThetaLayout(N_min, N_max,
+                                                      adaptive=True)
 
     def __call__(self, hypercube):
         """
@@ -85,9 +198,52 @@ class AdaptivePrior(Prior):
         where Nmax is the greatest allowed value of floor(N), i.e.
         the maximum number of nodes.
 
+        The floor(N)-2 x nodes in use are sorted uniform, and the
+        unused x nodes are uniform.
+
         """
-        prior = np.empty(hypercube.shape)
-        prior[[0]] = self._N_prior(hypercube[[0]])
-        self.__n_x_nodes = int(prior[0])
-        prior[1:] = super().__call__(hypercube[1:])
-        return prior
+        return super().__call__(hypercube)
+
+    def _transform(self, hypercube):
+        """Transform hypercube into theta."""
+        return self.batch(hypercube[None])[0]
+
+    def batch(self, hypercubes):
+        """
+        Prior for a stack of hypercubes, transformed in one vectorized pass.
+
+        Each row may use a different number of nodes.
+
+        Parameters
+        ----------
+        hypercubes : array-like, shape (n_points, n_dims)
+
+        Returns
+        -------
+        thetas : array-like, shape (n_points, n_dims)
+
+        """
+        hypercubes = np.atleast_2d(hypercubes)
+        thetas = np.empty(hypercubes.shape)
+        thetas[:, 0] = self._N_prior(hypercubes[:, 0])
+        return self._batch_transform(
+            hypercubes, thetas, self._adaptive_layout,
+            thetas[:, 0].astype(int) - 2,
+        )
+
+
+def _sorted_uniform_transform(hypercube, n_sorted):
+    """
+    Forced identifiability transform of the first n_sorted columns.
+
+    t_k = prod_(j=k)^(n-1) x_j^(1/(j+1)) for k < n = n_sorted, which is
+    the transform used by pypolychord's SortedUniformPrior, computed as
+    a reversed cumulative sum of logs so that n can differ between rows.
+    Columns from n_sorted onwards are left as they are.
+    """
+    columns = np.arange(hypercube.shape[-1])
+    used = columns < np.reshape(n_sorted, (-1, 1))
+    with np.errstate(divide="ignore"):
+        log_t = np.where(used, np.log(hypercube) / (columns + 1), 0)
+    log_t = np.cumsum(log_t[:, ::-1], axis=-1)[:, ::-1]
+    return np.where(used, np.exp(log_t), hypercube)
@@ -0,0 +1,105 @@
+"""Opt-in timing of flex-knot, likelihood and prior calls."""
+
+import random
+from collections import Counter
+from time import perf_counter
+
+import numpy as np
+
+
+class Stats:
+    """
+    Call counts and timings per stage, and the distribution of floor(N).
+
+    hook: callable, optional
+    Called as hook(stage, seconds) after every timed call.
+    max_samples: int, default 100000
+    Timings kept per stage for the percentiles. Beyond this, a uniform
+    reservoir sample of the timings is kept, while the counts and totals
+    stay exact.
+
+    The stages are:
+    "flexknot": FlexKnot.__call__
+    "prior": Prior.__call__
+    "likelihood": Likelihood.__call__, made up of
+    "nodes": reading the nodes out of theta,
+    "loglikelihood": the chi^2 or erf/logsumexp evaluation, and
+    "derived": any derived parameters.
+    """
+
+    def __init__(self, hook=None, max_samples=100000):
+        self.hook = hook
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.calls = Counter()
+        self.total = Counter()
+        self.nodes = Counter()
+        self._samples = {}
+
+    def time(self, stage, function, *args):
+        """Return function(*args), recording how long it took."""
+        start = perf_counter()
+        result = function(*args)
+        self.record(stage, perf_counter() - start)
+        return result
+
+    def record(self, stage, seconds):
+        """Record a call to stage that took seconds."""
+        self.calls[stage] += 1
+        self.total[stage] += seconds
+        samples = self._samples.setdefault(stage, [])
+        if len(samples) < self.max_samples:
+            samples.append(seconds)
+        else:
+            i = random.randrange(self.calls[stage])
+            if i < self.max_samples:
+                samples[i] = seconds
+        if self.hook is not None:
+            self.hook(stage, seconds)
+
+    def count_nodes(self, N):
+        """Record an adaptive call with floor(N) nodes."""
+        self.nodes[int(N)] += 1
+
+    def percentile(self, stage, q):
+        """q-th percentile(s) of the timings of stage, in seconds."""
+        return np.percentile(self._samples[stage], q)
+
+    def summary(self):
+        """
+        Timings of each stage.
+
+        Returns
+        -------
+        dict of stage: dict with keys
+            "calls", "total", "mean", "p50", "p90" and "p99",
+            with times in seconds.
+
+        """
+        summary = {}
+        for stage, calls in self.calls.items():
+            p50, p90, p99 = self.percentile(stage, [50, 90, 99])
+            summary[stage] = {
+                "calls": calls,
+                "total": self.total[stage],
+                "mean": self.total[stage] / calls,
+                "p50": p50,
+                "p90": p90,
+                "p99": p99,
+            }
+        return summary
+
+
+def create_stats(instrument):
+    """
+    Stats for the instrument argument of FlexKnot, Prior and Likelihood.
+
+    instrument is None or False for no instrumentation, True for a new
+    Stats, or a Stats to share between several objects.
+    """
+    if isinstance(instrument, Stats):
+        return instrument
+    return Stats() if instrument else None
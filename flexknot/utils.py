@@ -141,3 +141,120 @@ def get_y_nodes_from_theta(theta, adaptive):
         theta = get_theta_n(theta)
     n = len(theta) // 2 - 1
     return np.concatenate((theta[0:2*n+2:2], theta[-1:]))
+
+
+class ThetaLayout:
+    """
+    Precomputed positions of the x and y nodes within theta.
+
+    Built once for flex-knots with between N_min and N_max nodes, so that
+    the nodes can be read out of theta by slicing and indexing with stored
+    arrays, without revalidating theta or recomputing floor(N) each time.
+
+    Passing a layout to FlexKnot, AdaptiveKnot, Prior, AdaptivePrior or
+    Likelihood opts in to this as a trusted fast path: theta is assumed
+    to match the layout, and is not validated on each call.
+
+    N_min: int
+    N_max: int >= N_min
+    adaptive: bool
+    A non-adaptive layout describes exactly N_max nodes.
+    """
+
+    def __init__(self, N_min, N_max, adaptive):
+        if N_min < 0 or N_max < N_min:
+            raise ValueError("Need 0 <= N_min <= N_max.")
+        if not adaptive and N_min != N_max:
+            raise ValueError("A non-adaptive layout needs N_min == N_max.")
+        self.N_min = N_min
+        self.N_max = N_max
+        self.adaptive = adaptive
+
+        offset = int(adaptive)
+        if adaptive:
+            self.n_params = 2 * N_max - 1
+        else:
+            self.n_params = max(2 * N_max - 2, N_max)
+
+        self._x_slices = {}
+        self._y_indices = {}
+        for n in range(N_min, N_max + 1):
+            self._x_slices[n] = slice(offset + 1, offset + max(2 * n - 3, 1),
+                                      2)
+            if n == 0:
+                self._y_indices[n] = np.array([], dtype=int)
+            else:
+                self._y_indices[n] = np.append(
+                    np.arange(offset, offset + 2 * n - 3, 2),
+                    self.n_params - 1,
+                )
+
+    def n(self, theta):
+        """Number of nodes used by theta."""
+        if self.adaptive:
+            return int(theta[0])
+        return self.N_max
+
+    def validate(self, theta):
+        """Check that theta matches the layout."""
+        if len(theta) != self.n_params:
+            raise ValueError(
+                f"theta must contain {self.n_params} elements for this layout."
+            )
+        if self.adaptive and not self.N_min <= np.floor(theta[0]) \
+                <= self.N_max:
+            raise ValueError("floor(theta[0]) must be between N_min and "
+                             "N_max.")
+
+    def x_index(self, n=None):
+        """Slice of theta holding the n-2 interior x nodes."""
+        return self._x_slices[self.N_max if n is None else n]
+
+    def y_index(self, n=None):
+        """Indices of theta holding the n y nodes."""
+        return self._y_indices[self.N_max if n is None else n]
+
+    def x_nodes(self, theta, n=None):
+        """
+        View of the interior x nodes.
+
+        Parameters
+        ----------
+        theta : array-like
+
+        n : int, optional
+            Number of nodes in use, if already known.
+
+        Returns
+        -------
+        x_nodes : array-like
+        [x1, ... x_(n-2)]
+
+        """
+        if n is None:
+            n = self.n(theta)
+        return theta[self._x_slices[n]]
+
+    def y_nodes(self, theta, n=None, out=None):
+        """
+        The y nodes, optionally written into out.
+
+        Parameters
+        ----------
+        theta : array-like
+
+        n : int, optional
+            Number of nodes in use, if already known.
+
+        out : array-like, optional
+            Array of length n to write the y nodes into.
+
+        Returns
+        -------
+        y_nodes : array-like
+        [y0, y1, ..., y_(n-2), y_(n-1)]
+
+        """
+        if n is None:
+            n = self.n(theta)
+        return np.take(theta, self._y_indices[n], out=out)
@@ -1,4 +1,5 @@
 import numpy as np
+from scipy.integrate import quad
 from flexknot import FlexKnot, AdaptiveKnot
 from flexknot.utils import get_theta_n
 
@@ -33,3 +34,56 @@ def test_area():
     assert ak.area(theta0, theta1) == ak.area(theta1, theta0)
     assert ak.area(theta0, theta1) == fk.area(get_theta_n(theta0),
                                               get_theta_n(theta1))
+
+
+def test_area_matches_quadrature():
+    """
+    Test the exact area and L2 distance against numerical quadrature.
+    """
+    x_min = 1
+    x_max = 2
+    rng = np.random.default_rng()
+    fk = FlexKnot(x_min, x_max)
+    theta0 = rng.uniform(-1, 1, 10)
+    theta1 = rng.uniform(-1, 1, 6)
+    theta0[1:-1:2] = np.sort(rng.uniform(x_min, x_max, 4))
+    theta1[1:-1:2] = np.sort(rng.uniform(x_min, x_max, 2))
+    points = np.concatenate((theta0[1:-1:2], theta1[1:-1:2]))
+
+    def difference(x):
+        return fk(x, theta0) - fk(x, theta1)
+
+    assert np.isclose(
+        fk.area(theta0, theta1),
+        quad(lambda x: np.abs(difference(x)), x_min, x_max,
+             points=points, limit=200)[0] / (x_max - x_min),
+    )
+    assert np.isclose(
+        fk.area(theta0, theta1, p=2),
+        np.sqrt(quad(lambda x: difference(x)**2, x_min, x_max,
+                     points=points, limit=200)[0] / (x_max - x_min)),
+    )
+
+
+def test_area_matrix():
+    """
+    Test that area_matrix agrees with pairwise calls to area, including
+    adaptive flex-knots with different numbers of nodes.
+    """
+    x_min = 1
+    x_max = 2
+    N_max = 6
+    rng = np.random.default_rng()
+    thetas = rng.uniform(-1, 1, (12, 2 * N_max - 1))
+    thetas[:, 0] = rng.uniform(0, N_max + 1, 12)
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (12, N_max - 2)))
+
+    ak = AdaptiveKnot(x_min, x_max)
+    for p in [1, 2]:
+        expected = np.array([[ak.area(theta0, theta1, p) for theta1 in thetas]
+                             for theta0 in thetas])
+        assert np.allclose(ak.area_matrix(thetas, p, block_size=7), expected)
+        i, j = np.triu_indices(len(thetas), k=1)
+        assert np.allclose(ak.area_matrix(thetas, p, condensed=True,
+                                          processes=2),
+                           expected[i, j])
@@ -0,0 +1,101 @@
+"""Test the LRU evaluation cache."""
+
+import pickle
+
+import numpy as np
+from flexknot import AdaptiveKnot, Likelihood
+from flexknot.cache import LRUCache
+
+
+def test_lru_eviction():
+    """
+    Test that the least recently used result is evicted, and that hits
+    and misses are counted.
+    """
+    cache = LRUCache(2)
+    calls = []
+
+    def square(a):
+        calls.append(a)
+        return a**2
+
+    for a in [1, 2, 1, 3, 2]:
+        cache.lookup(a, square, a)
+    # 2 was evicted by 3, as 1 had been used more recently
+    assert calls == [1, 2, 3, 2]
+    assert (cache.hits, cache.misses) == (1, 4)
+    assert len(cache) == 2
+
+
+def test_grid_keys():
+    """
+    Test that grids are keyed by identity, and that a grid's results are
+    dropped once it is garbage collected.
+    """
+    cache = LRUCache(10)
+    theta = np.arange(4.0)
+    x = np.linspace(0, 1, 5)
+    assert cache.key(theta, x) == cache.key(theta, x)
+    assert cache.key(theta, x) != cache.key(theta, x.copy())
+    assert cache.key(theta, 0.5) == cache.key(theta, 0.5)
+
+    cache.lookup(cache.key(theta, x), np.sum, x)
+    cache.lookup(cache.key(theta, 0.5), np.sum, 0.5)
+    assert 2 == len(cache)
+    del x
+    assert 1 == len(cache)
+    assert not cache._grids
+
+
+def test_flexknot_cache():
+    """
+    Test that a cached flex-knot returns the same results, keyed on both
+    theta and the identity of the grid.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    theta = rng.uniform(-1, 1, 2 * N_max - 1)
+    theta[0] = N_max
+    theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+    xs = np.linspace(x_min, x_max, 100)
+
+    ak = AdaptiveKnot(x_min, x_max)
+    cached = AdaptiveKnot(x_min, x_max, cache=10)
+    for x in [xs, xs, xs[::2], xs.copy()]:
+        assert np.all(ak(x, theta) == cached(x, theta))
+    assert (cached.cache.hits, cached.cache.misses) == (1, 3)
+
+    logl = Likelihood(x_min, x_max, xs, ak(xs, theta), 0.1, adaptive=True,
+                      cache=10)
+    assert logl(theta) == logl(theta)
+    assert (logl.cache.hits, logl.cache.misses) == (1, 1)
+
+
+def test_cache_pickle():
+    """
+    Test that cached flex-knots and likelihoods pickle after use, with an
+    empty cache that still works.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    theta = rng.uniform(-1, 1, 2 * N_max - 1)
+    theta[0] = N_max
+    theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+    xs = np.linspace(x_min, x_max, 100)
+
+    cached = AdaptiveKnot(x_min, x_max, cache=10)
+    expected = cached(xs, theta)
+    cached(0.5, theta)
+    restored = pickle.loads(pickle.dumps(cached))
+    assert 0 == len(restored.cache)
+    assert 10 == restored.cache.maxsize
+    assert np.all(restored(xs, theta) == expected)
+    assert np.all(restored(xs, theta) == expected)
+    assert (restored.cache.hits, restored.cache.misses) == (1, 1)
+
+    logl = Likelihood(x_min, x_max, xs, expected, 0.1, adaptive=True,
+                      cache=10)
+    restored = pickle.loads(pickle.dumps(logl))
+    assert logl(theta) == restored(theta)
@@ -0,0 +1,100 @@
+"""Test the factorised covariances and the correlated-errors likelihood."""
+
+import numpy as np
+import pytest
+from scipy.linalg import block_diag
+from scipy.stats import multivariate_normal
+from flexknot import FlexKnot, Likelihood
+from flexknot.covariance import (BlockDiagonalCovariance, DenseCovariance,
+                                 DiagonalPlusLowRankCovariance)
+from flexknot.parallel import ShardedLikelihood
+
+rng = np.random.default_rng()
+x_min, x_max = 0, 1
+n = 30
+x_data = rng.uniform(x_min, x_max, n)
+y_data = rng.normal(size=n)
+diagonal = rng.uniform(0.1, 0.5, n)
+factor = rng.normal(0, 0.3, (n, 2))
+blocks = []
+for size in [10, 12, 8]:
+    a = rng.normal(size=(size, size))
+    blocks.append(a @ a.T / size + np.eye(size) * 0.1)
+covariances = [
+    (DenseCovariance(np.diag(diagonal) + factor @ factor.T),
+     np.diag(diagonal) + factor @ factor.T),
+    (BlockDiagonalCovariance(blocks), block_diag(*blocks)),
+    (DiagonalPlusLowRankCovariance(diagonal, factor),
+     np.diag(diagonal) + factor @ factor.T),
+]
+
+
+def test_covariances():
+    """
+    Test chi2, solve and the normalisation against the dense matrices,
+    for one and for a stack of residuals.
+    """
+    residuals = rng.normal(size=(4, n))
+    for covariance, matrix in covariances:
+        assert len(covariance) == n
+        assert np.allclose(covariance.solve(residuals),
+                           np.linalg.solve(matrix, residuals.T).T)
+        assert np.allclose(covariance.chi2(residuals[0]),
+                           residuals[0] @ np.linalg.solve(matrix,
+                                                          residuals[0]))
+        whitened = covariance.whiten(residuals)
+        assert np.allclose(np.sum(whitened**2, axis=-1),
+                           covariance.chi2(residuals))
+        assert np.isclose(
+            covariance.normalisation,
+            multivariate_normal(np.zeros(n), matrix).logpdf(np.zeros(n)),
+        )
+
+
+def test_likelihood_covariance():
+    """
+    Test the likelihood with a covariance against a multivariate normal,
+    and against per-point sigma for a diagonal covariance, and test the
+    batch and gradient.
+    """
+    N = 4
+    theta = rng.uniform(-1, 1, 2 * N - 2)
+    theta[1:-1:2] = np.sort(rng.uniform(x_min, x_max, N - 2))
+    f = FlexKnot(x_min, x_max)(x_data, theta)
+    for covariance, matrix in covariances:
+        logl = Likelihood(x_min, x_max, x_data, y_data, covariance,
+                          adaptive=False)
+        assert np.isclose(logl(theta)[0],
+                          multivariate_normal(f, matrix).logpdf(y_data))
+        assert np.allclose(logl.batch([theta, theta * 0.9]),
+                           [logl(theta)[0], logl(theta * 0.9)[0]])
+
+        logL, grad = logl.value_and_grad(theta)
+        assert np.isclose(logL, logl(theta)[0])
+        h = 1e-6
+        for i in range(len(theta)):
+            step = np.zeros(len(theta))
+            step[i] = h
+            assert np.isclose(grad[i], (logl(theta + step)[0]
+                                        - logl(theta - step)[0]) / 2 / h,
+                              rtol=1e-4, atol=1e-4)
+
+    independent = Likelihood(x_min, x_max, x_data, y_data, np.sqrt(diagonal),
+                             adaptive=False)
+    correlated = Likelihood(x_min, x_max, x_data, y_data,
+                            DenseCovariance(np.diag(diagonal)),
+                            adaptive=False)
+    assert np.isclose(independent(theta)[0], correlated(theta)[0])
+
+
+def test_covariance_errors():
+    """Test that mismatched sizes and sharding are rejected."""
+    with pytest.raises(ValueError):
+        Likelihood(x_min, x_max, x_data[:-1], y_data[:-1],
+                   covariances[0][0], adaptive=False)
+    with pytest.raises(ValueError):
+        Likelihood(x_min, x_max, x_data, y_data, covariances[0][0],
+                   adaptive=False, chunk_size=10)
+    with pytest.raises(ValueError):
+        ShardedLikelihood(x_min, x_max, x_data, y_data, covariances[0][0],
+                          adaptive=False)
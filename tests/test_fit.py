@@ -0,0 +1,78 @@
+"""Test the multi-start maximum-likelihood fitter."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flexknot import AdaptiveKnot, AdaptivePrior, Likelihood, Prior
+from flexknot.fit import maximise_likelihood
+
+
+def test_maximise_likelihood():
+    """
+    Test that the fit for each N does at least as well as the truth,
+    that extra nodes do not make the fit worse, and that spreading the
+    starts over processes gives the same results.
+    """
+    rng = np.random.default_rng(0)
+    x_min, x_max = 0, 1
+    N_max = 5
+    truth = np.array([4.5, -0.5, 0.3, 0.8, 0.6, -0.2, 0, 0, 0.4])
+    x_data = rng.uniform(x_min, x_max, 200)
+    sigma = 0.1
+    y_data = (AdaptiveKnot(x_min, x_max)(x_data, truth)
+              + rng.normal(0, sigma, 200))
+
+    logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True)
+    prior = AdaptivePrior(x_min, x_max, -1, 1, 1, N_max)
+    best = maximise_likelihood(logl, prior, n_starts=5, rng=1)
+    assert sorted(best) == list(range(1, N_max + 1))
+    assert all(type(N) is int for N in best)
+    assert best[4][1] >= logl(truth)[0]
+    for N in range(1, N_max):
+        assert best[N + 1][1] >= best[N][1] - 1e-6
+    for N, (theta, logL) in best.items():
+        assert int(theta[0]) == N
+        assert logL == logl(theta)[0]
+        assert np.all(np.diff(theta[2:2*N-3:2]) >= 0)
+
+    parallel = maximise_likelihood(logl, prior, N=[3, 4], n_starts=5,
+                                   processes=2, rng=1)
+    serial = maximise_likelihood(logl, prior, N=[3, 4], n_starts=5, rng=1)
+    for N in [3, 4]:
+        assert np.allclose(parallel[N][0], serial[N][0])
+
+    # non-adaptive
+    logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=False)
+    prior = Prior(x_min, x_max, -1, 1)
+    best = maximise_likelihood(logl, prior, N=np.array([4]), n_starts=5,
+                               rng=1)
+    assert [type(N) for N in best] == [int]
+    theta, logL = best[4]
+    assert len(theta) == 6
+    assert logL >= logl(np.append(truth[1:6], truth[-1]))[0]
+
+
+def test_maximise_likelihood_threads():
+    """
+    Test that fits of different likelihoods in concurrent threads match
+    the same fits run one after the other.
+    """
+    rng = np.random.default_rng(0)
+    x_min, x_max = 0, 1
+    prior = Prior(x_min, x_max, -1, 1)
+    x_data = rng.uniform(x_min, x_max, 100)
+    likelihoods = [
+        Likelihood(x_min, x_max, x_data, rng.normal(0, 0.1, 100), 0.1,
+                   adaptive=False)
+        for _ in range(4)
+    ]
+
+    def fit(logl):
+        return maximise_likelihood(logl, prior, N=3, n_starts=3, rng=1)[3]
+
+    serial = [fit(logl) for logl in likelihoods]
+    with ThreadPoolExecutor(4) as executor:
+        threaded = list(executor.map(fit, likelihoods))
+    for (theta, logL), (expected, expected_logL) in zip(threaded, serial):
+        assert np.array_equal(theta, expected)
+        assert logL == expected_logL
@@ -3,8 +3,11 @@ Test that flexknot returns the same results as np.interp, and that
 AdaptiveKnot does the same as FlexKnot.
 """
 
+import tracemalloc
+
 import numpy as np
 from flexknot import AdaptiveKnot, FlexKnot
+from flexknot.utils import ThetaLayout
 
 
 def test_flexknot():
@@ -77,3 +80,102 @@ def test_adaptive_minus_1():
         np.full(100, -1)
         == AdaptiveKnot(x_min, x_max)(np.linspace(x_min, x_max, 100), theta)
     )
+
+
+def test_flexknot_batch():
+    """
+    Test that FlexKnot.batch gives the same results as looping over thetas.
+    """
+    rng = np.random.default_rng()
+    x_min = 0
+    x_max = 1
+    n = 8
+    thetas = rng.uniform(-10, 10, (50, 2 * n + 2))
+    thetas[:, 1:2*n+1:2] = np.sort(rng.uniform(x_min, x_max, (50, n)))
+    xs = np.linspace(x_min, x_max, 100)
+    flexknot = FlexKnot(x_min, x_max)
+    assert np.allclose(
+        np.array([flexknot(xs, theta) for theta in thetas]),
+        flexknot.batch(xs, thetas),
+    )
+
+
+def test_adaptive_flexknot_batch():
+    """
+    Test that AdaptiveKnot.batch gives the same results as looping over
+    thetas, when each row uses a different number of nodes.
+    """
+    rng = np.random.default_rng()
+    x_min = 0
+    x_max = 1
+    N_max = 10
+    thetas = rng.uniform(-10, 10, (50, 2 * N_max - 1))
+    thetas[:, 0] = rng.uniform(0, N_max + 1, 50)
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (50, N_max - 2)))
+    xs = np.linspace(x_min, x_max, 100)
+    adaptive_flexknot = AdaptiveKnot(x_min, x_max)
+    assert np.allclose(
+        np.array([adaptive_flexknot(xs, theta) for theta in thetas]),
+        adaptive_flexknot.batch(xs, thetas),
+    )
+
+
+def test_adaptive_flexknot_layout():
+    """
+    Test that AdaptiveKnot gives the same results with a ThetaLayout.
+    """
+    rng = np.random.default_rng()
+    x_min = 0
+    x_max = 1
+    N_max = 10
+    theta = rng.uniform(-10, 10, 2 * N_max - 1)
+    theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+    xs = np.linspace(x_min, x_max, 100)
+    layout = ThetaLayout(0, N_max, adaptive=True)
+    for n in range(N_max + 1):
+        theta[0] = n + rng.random()
+        assert np.all(
+            AdaptiveKnot(x_min, x_max)(xs, theta)
+            == AdaptiveKnot(x_min, x_max, layout=layout)(xs, theta)
+        )
+
+
+def test_flexknot_out():
+    """
+    Test that out= writes the same results into an existing array, with
+    and without a layout or cache, and for constant flex-knots, and that
+    large grids are written in place.
+    """
+    x_min, x_max = 0, 1
+    N_max = 6
+    rng = np.random.default_rng()
+    x = rng.uniform(x_min, x_max, 50)
+    thetas = rng.uniform(-1, 1, (4, 2 * N_max - 1))
+    thetas[:, 0] = [0.5, 1.5, 4.5, 6.5]
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (4, N_max - 2)))
+    for flexknot in [AdaptiveKnot(x_min, x_max),
+                     AdaptiveKnot(x_min, x_max,
+                                  layout=ThetaLayout(0, N_max, True)),
+                     AdaptiveKnot(x_min, x_max, cache=10)]:
+        out = np.empty((len(thetas), len(x)))
+        for theta, row in zip(thetas, out):
+            assert flexknot(x, theta, out=row) is row
+        assert np.array_equal(out, [flexknot(x, theta) for theta in thetas])
+
+    out = np.empty(len(x))
+    FlexKnot(x_min, x_max)(x, thetas[2, 1:], out=out)
+    assert np.array_equal(out, FlexKnot(x_min, x_max)(x, thetas[2, 1:]))
+
+    # a grid large enough to be computed in place, without allocating
+    x = np.linspace(x_min - 0.1, x_max + 0.1, 100000)
+    out = np.empty(len(x))
+    for flexknot in [AdaptiveKnot(x_min, x_max),
+                     AdaptiveKnot(x_min, x_max,
+                                  layout=ThetaLayout(0, N_max, True))]:
+        for theta in thetas:
+            tracemalloc.start()
+            flexknot(x, theta, out=out)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert peak < x.nbytes / 4
+            assert np.array_equal(out, flexknot(x, theta))
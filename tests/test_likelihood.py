@@ -1,10 +1,18 @@
 """
 Test get_likelihood in two trivial cases simple enough to work out by hand.
 """
+import pickle
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import pytest
+from scipy.integrate import trapezoid
 from scipy.special import erf
-from flexknot import Likelihood
-from flexknot.utils import create_theta
+from flexknot import FlexKnot, JointLikelihood, Likelihood, kernels
+from flexknot.likelihoods import (
+    _TRUNCATION_RTOL, _log_truncation_bound, _xy_errors_truncated_lse,
+)
+from flexknot.utils import ThetaLayout, create_theta
 
 
 def test_likelihood():
@@ -57,3 +65,542 @@ def test_likelihood_sigma_x():
         logl(theta)[0], np.log((erf(1) - erf(0)) * (erf(0) - erf(-1))
                                / (16 * np.pi))
     )
+
+
+def test_likelihood_batch():
+    """
+    Test that Likelihood.batch agrees with calling the likelihood on each
+    theta in turn, for both sigma_y and sigma_x, sigma_y data, including
+    sigma_y data processed in blocks.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    x_data = rng.uniform(x_min, x_max, 20)
+    y_data = rng.normal(size=20)
+    thetas = rng.uniform(-1, 1, (10, 2 * N_max - 1))
+    thetas[:, 0] = rng.uniform(0, N_max + 1, 10)
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (10, N_max - 2)))
+
+    for sigma, kwargs in [(0.5, {}), (rng.uniform(0.5, 1, 20), {}),
+                          (np.array([0.1, 0.5]), {}),
+                          (rng.uniform(0.5, 1, 20), {"chunk_size": 7})]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True,
+                          **kwargs)
+        assert np.allclose(
+            np.array([logl(theta)[0] for theta in thetas]),
+            logl.batch(thetas),
+        )
+
+
+def test_likelihood_sigma_x_chunked():
+    """
+    Test that processing the data in blocks gives the same likelihood
+    as processing it all at once.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    n = 10
+    x_data = rng.uniform(x_min, x_max, 101)
+    y_data = rng.normal(size=101)
+    theta = rng.uniform(-1, 1, 2 * n + 2)
+    theta[1:2*n+1:2] = np.sort(rng.uniform(x_min, x_max, n))
+
+    for sigma in [np.array([0.1, 0.5]), rng.uniform(0.1, 1, (2, 101))]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=False)
+        chunked = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                             adaptive=False, chunk_size=7)
+        capped = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                            adaptive=False, max_memory=10_000)
+        assert np.isclose(logl(theta)[0], chunked(theta)[0])
+        assert np.isclose(logl(theta)[0], capped(theta)[0])
+
+
+def test_likelihood_sigma_x_max_memory():
+    """
+    Test that max_memory caps the memory used by the likelihood and its
+    gradient with sigma_x, with and without truncate.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    n = 20
+    x_data = rng.uniform(x_min, x_max, 5000)
+    y_data = rng.normal(size=5000)
+    theta = rng.uniform(-1, 1, 2 * n + 2)
+    theta[1:2*n+1:2] = np.sort(rng.uniform(x_min, x_max, n))
+    max_memory = 5e5
+
+    for sigma in [np.array([0.01, 0.5]), rng.uniform(0.01, 1, (2, 5000))]:
+        for kwargs in [{}, {"truncate": 5}]:
+            logl = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                              adaptive=False, **kwargs)
+            capped = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                                adaptive=False, max_memory=max_memory,
+                                **kwargs)
+            # the first call sizes the reused buffers
+            capped(theta)
+            for method in ["__call__", "value_and_grad"]:
+                tracemalloc.start()
+                value = getattr(capped, method)(theta)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                assert peak < max_memory
+                assert np.allclose(value[0], getattr(logl, method)(theta)[0])
+
+
+def test_likelihood_sufficient_statistics():
+    """
+    Test that the sufficient-statistics likelihood agrees with the direct
+    sum over the data, including data outside [x_min, x_max] and N = 0
+    or 1.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 8
+    x_data = rng.uniform(-0.1, 1.1, 1000)
+    y_data = rng.normal(size=1000)
+    thetas = rng.uniform(-1, 1, (20, 2 * N_max - 1))
+    thetas[:, 0] = rng.uniform(0, N_max + 1, 20)
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (20, N_max - 2)))
+
+    for sigma in [0.5, rng.uniform(0.5, 1, 1000)]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True)
+        fast = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True,
+                          sufficient_statistics=True)
+        assert np.allclose(logl.batch(thetas), fast.batch(thetas))
+
+
+def test_likelihood_sufficient_statistics_precision():
+    """
+    Test the sufficient-statistics likelihood against the direct sum for a
+    large, high signal-to-noise dataset, where chi^2 is a tiny fraction of
+    the sum of (y / sigma)^2.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N = 10
+    n = 200000
+    theta = np.empty(2 * N - 2)
+    theta[0::2] = rng.uniform(-100, 100, N - 1)
+    theta[1:-1:2] = np.sort(rng.uniform(x_min, x_max, N - 2))
+    theta[-1] = 50
+    x_data = rng.uniform(x_min, x_max, n)
+    for sigma in [1e-2, 1e-4]:
+        y_data = (FlexKnot(x_min, x_max)(x_data, theta)
+                  + rng.normal(0, sigma, n))
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                          adaptive=False)
+        fast = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                          adaptive=False, sufficient_statistics=True)
+        step = np.where(np.arange(len(theta)) % 2, 0, sigma)
+        for t in [theta, theta + step]:
+            assert np.isclose(logl(t)[0], fast(t)[0], rtol=0, atol=1e-3)
+
+
+def test_likelihood_sigma_x_truncated():
+    """
+    Test that only pairing points with segments within a few sigma_x
+    gives the same likelihood as using every segment, to within the
+    relative accuracy of each point's sum over segments, and that few
+    points need every segment even for small truncate.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    n = 20
+    x_data = rng.uniform(x_min, x_max, 500)
+    y_data = rng.normal(size=500)
+    theta = rng.uniform(-1, 1, 2 * n + 2)
+    theta[1:2*n+1:2] = np.sort(rng.uniform(x_min, x_max, n))
+
+    for sigma in [np.array([0.01, 0.5]),
+                  np.array([rng.uniform(0.001, 0.02, 500),
+                            rng.uniform(0.1, 1, 500)])]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=False)
+        for truncate in [2, 3, 10]:
+            truncated = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                                   adaptive=False, truncate=truncate)
+            assert np.isclose(logl(theta)[0], truncated(theta)[0], rtol=0,
+                              atol=500 * _TRUNCATION_RTOL)
+
+        x_nodes, y_nodes = FlexKnot(x_min, x_max)._nodes(theta)
+        ms = np.diff(y_nodes) / np.diff(x_nodes)
+        cs = y_nodes[:-1] - ms * x_nodes[:-1]
+        lse = _xy_errors_truncated_lse(x_nodes, ms, cs, x_data, y_data,
+                                       *sigma, 4)
+        bound = _log_truncation_bound(x_nodes, x_data, *sigma, 4)
+        assert np.mean(lse < bound - np.log(_TRUNCATION_RTOL)) < 0.25
+
+
+def test_likelihood_layout():
+    """
+    Test that Likelihood gives the same results with a ThetaLayout.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    x_data = rng.uniform(x_min, x_max, 20)
+    y_data = rng.normal(size=20)
+    theta = rng.uniform(-1, 1, 2 * N_max - 1)
+    theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+    layout = ThetaLayout(0, N_max, adaptive=True)
+
+    for sigma in [0.5, np.array([0.1, 0.5])]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True)
+        fast = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True,
+                          layout=layout)
+        for n in range(N_max + 1):
+            theta[0] = n + rng.random()
+            assert np.isclose(logl(theta)[0], fast(theta)[0])
+
+
+def test_likelihood_kernels():
+    """
+    Test the fused kernels behind the numba backend against the numpy
+    likelihood. Without numba, these run as plain Python.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    n = 5
+    x_data = rng.uniform(x_min, x_max, 30)
+    y_data = rng.normal(size=30)
+    sigma_x = rng.uniform(0.01, 0.1, 30)
+    sigma_y = rng.uniform(0.1, 1, 30)
+    theta = rng.uniform(-1, 1, 2 * n + 2)
+    theta[1:2*n+1:2] = np.sort(rng.uniform(x_min, x_max, n))
+    x_nodes = np.concatenate(([x_min], theta[1:2*n+1:2], [x_max]))
+    y_nodes = np.append(theta[0:2*n+2:2], theta[-1])
+    ms = np.diff(y_nodes) / np.diff(x_nodes)
+    cs = y_nodes[:-1] - ms * x_nodes[:-1]
+
+    logl = Likelihood(x_min, x_max, x_data, y_data, sigma_y, adaptive=False)
+    assert np.isclose(
+        logl(theta)[0],
+        -0.5 * np.sum(np.log(2 * np.pi * sigma_y**2))
+        - 0.5 * kernels.y_errors_chi2(x_data, y_data, sigma_y**2,
+                                      x_nodes, y_nodes),
+    )
+
+    logl = Likelihood(x_min, x_max, x_data, y_data,
+                      np.array([sigma_x, sigma_y]), adaptive=False)
+    assert np.isclose(
+        logl(theta)[0],
+        -30 * (np.log(2) + 0.5 * np.log(2 * np.pi * (x_max - x_min)))
+        + kernels.xy_errors_logsumexp(x_data, y_data, sigma_x, sigma_y,
+                                      x_nodes, ms, cs, np.inf, 1e-8),
+    )
+
+
+@pytest.mark.filterwarnings("ignore:numba is not installed")
+def test_likelihood_numba_backend():
+    """
+    Test that the numba backend, or its fallback, matches numpy.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    x_data = rng.uniform(x_min, x_max, 30)
+    y_data = rng.normal(size=30)
+    thetas = rng.uniform(-1, 1, (10, 2 * N_max - 1))
+    thetas[:, 0] = rng.uniform(0, N_max + 1, 10)
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (10, N_max - 2)))
+
+    for sigma in [0.5, np.array([0.1, 0.5])]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True)
+        jit = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True,
+                         backend="numba")
+        assert np.allclose(logl.batch(thetas), jit.batch(thetas))
+
+
+def test_likelihood_pickle():
+    """
+    Test that configured likelihoods survive a round trip through pickle.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    x_data = rng.uniform(x_min, x_max, 20)
+    y_data = rng.normal(size=20)
+    theta = rng.uniform(-1, 1, 2 * N_max - 1)
+    theta[0] = N_max
+    theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+
+    for sigma, kwargs in [
+        (0.5, {}),
+        (0.5, {"sufficient_statistics": True}),
+        (np.array([0.1, 0.5]), {"truncate": 5, "chunk_size": 7}),
+        (np.array([0.1, 0.5]), {"layout": ThetaLayout(0, N_max, True)}),
+    ]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True,
+                          **kwargs)
+        assert logl(theta) == pickle.loads(pickle.dumps(logl))(theta)
+
+
+def test_likelihood_from_files(tmp_path):
+    """
+    Test that likelihoods built on memory-mapped files agree with the
+    in-memory likelihood, and pickle by file name.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    n = 5
+    x_data = rng.uniform(x_min, x_max, 100)
+    y_data = rng.normal(size=100)
+    theta = rng.uniform(-1, 1, 2 * n + 2)
+    theta[1:2*n+1:2] = np.sort(rng.uniform(x_min, x_max, n))
+
+    np.save(tmp_path / "xs.npy", x_data)
+    y_data.tofile(tmp_path / "ys.dat")
+    for sigma in [rng.uniform(0.1, 1, 100), rng.uniform(0.1, 1, (2, 100))]:
+        sigma.tofile(tmp_path / "sigma.dat")
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=False)
+        mapped = Likelihood.from_files(
+            x_min, x_max, tmp_path / "xs.npy", tmp_path / "ys.dat",
+            tmp_path / "sigma.dat", adaptive=False, chunk_size=16,
+        )
+        assert np.isclose(logl(theta)[0], mapped(theta)[0])
+        assert np.isclose(logl(theta)[0],
+                          pickle.loads(pickle.dumps(mapped))(theta)[0])
+        assert len(pickle.dumps(mapped)) < x_data.nbytes
+
+
+def test_likelihood_derived():
+    """
+    Test that the derived values, integrals and slopes match the flex-knot,
+    and that log(L) is unchanged.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 6
+    x_data = rng.uniform(x_min, x_max, 100)
+    y_data = rng.normal(size=100)
+    derived_x = [0.0, 0.3, 1.0]
+    derived_integrals = [[0, 1], [0.2, 0.7], [-0.5, 1.5]]
+    derived_slopes = [-0.1, 0.45, 1.0]
+    grid = np.linspace(-0.5, 1.5, 200001)
+    for N in [0, 1, 2, 5, N_max]:
+        theta = rng.uniform(-1, 1, 2 * N_max - 1)
+        theta[0] = N + 0.5
+        theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+        logl = Likelihood(x_min, x_max, x_data, y_data, 0.5, adaptive=True)
+        derived = Likelihood(x_min, x_max, x_data, y_data, 0.5,
+                             adaptive=True, derived_x=derived_x,
+                             derived_integrals=derived_integrals,
+                             derived_slopes=derived_slopes)
+        assert 9 == derived.n_derived
+        assert 0 == logl.n_derived
+        logL, values = derived(theta)
+        assert logL == logl(theta)[0]
+
+        flexknot = derived._likelihood_function.flexknot
+        assert np.allclose(values[:3], flexknot(np.array(derived_x), theta))
+        f = flexknot(grid, theta)
+        for (a, b), integral in zip(derived_integrals, values[3:6]):
+            inside = (grid >= a) & (grid <= b)
+            assert np.isclose(integral, trapezoid(f[inside], grid[inside]),
+                              atol=1e-4)
+        h = 1e-7
+        assert np.allclose(
+            values[6:],
+            (flexknot(np.array(derived_slopes) + h, theta)
+             - flexknot(np.array(derived_slopes), theta)) / h,
+            atol=1e-4,
+        )
+
+
+def test_likelihood_sigma_x_outliers():
+    """
+    Test that the sigma_x likelihood of points many sigma from the
+    flex-knot is finite and accurate, with and without truncation.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    n = 5
+    x_data = rng.uniform(x_min, x_max, 20)
+    y_data = rng.choice([-1, 1], 20) * rng.uniform(3, 5, 20)
+    sigma_x = rng.uniform(0.001, 0.02, 20)
+    sigma_y = rng.uniform(0.05, 0.1, 20)
+    theta = rng.uniform(-1, 1, 2 * n + 2)
+    theta[1:2*n+1:2] = np.sort(rng.uniform(x_min, x_max, n))
+
+    flexknot = FlexKnot(x_min, x_max)
+    grid = np.linspace(x_min, x_max, 1000001)
+    expected = -20 * (np.log(2) + 0.5 * np.log(2 * np.pi * (x_max - x_min)))
+    for x_i, y_i, sigma_x_i, sigma_y_i in zip(x_data, y_data,
+                                              sigma_x, sigma_y):
+
+        def exponent(x):
+            return (-(x - x_i)**2 / 2 / sigma_x_i**2
+                    - (y_i - flexknot(x, theta))**2 / 2 / sigma_y_i**2)
+
+        # outliers are sharply peaked, so refine the grid around the peak
+        peak = grid[np.argmax(exponent(grid))]
+        x = np.union1d(grid, np.clip(np.linspace(peak - 1e-4, peak + 1e-4,
+                                                 100001), x_min, x_max))
+        exponent = exponent(x)
+        shift = exponent.max()
+        expected += (shift + np.log(trapezoid(np.exp(exponent - shift), x))
+                     + np.log(2 / np.sqrt(2 * np.pi) / sigma_x_i
+                              / sigma_y_i))
+
+    sigma = np.array([sigma_x, sigma_y])
+    for kwargs in [{}, {"truncate": 5}, {"backend": "numba"},
+                   {"backend": "numba", "truncate": 5}]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                          adaptive=False, **kwargs)
+        assert np.isclose(logl(theta)[0], expected, rtol=1e-6)
+
+
+def test_likelihood_value_and_grad():
+    """
+    Test that value_and_grad agrees with __call__ and with central
+    differences, for every branch of the likelihood.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 6
+    n = 50
+    x_data = rng.uniform(-0.1, 1.1, n)
+    y_data = rng.normal(size=n)
+    sigmas = [0.5, rng.uniform(0.5, 1, n),
+              np.array([0.05, 0.5]), rng.uniform(0.05, 0.5, (2, n))]
+    options = [{}, {"chunk_size": 7}, {"sufficient_statistics": True},
+               {"truncate": 5}]
+    h = 1e-6
+    for N in [1, 2, 4, N_max]:
+        theta = rng.uniform(-1, 1, 2 * N_max - 1)
+        theta[0] = N + 0.5
+        theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+        for sigma in sigmas:
+            for kwargs in options:
+                if "sufficient_statistics" in kwargs \
+                        and np.shape(sigma)[:1] == (2,):
+                    continue
+                logl = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                                  adaptive=True, **kwargs)
+                logL, grad = logl.value_and_grad(theta)
+                assert np.isclose(logL, logl(theta)[0])
+                assert grad.shape == theta.shape
+                numerical = np.zeros(len(theta))
+                for i in range(1, len(theta)):
+                    step = np.zeros(len(theta))
+                    step[i] = h
+                    numerical[i] = (logl(theta + step)[0]
+                                    - logl(theta - step)[0]) / 2 / h
+                assert np.allclose(grad, numerical, rtol=1e-4, atol=1e-4)
+
+    # non-adaptive
+    theta = create_theta(np.sort(rng.uniform(x_min, x_max, 3)),
+                         rng.uniform(-1, 1, 5))
+    logl = Likelihood(x_min, x_max, x_data, y_data, sigmas[-1],
+                      adaptive=False)
+    _, grad = logl.value_and_grad(theta)
+    for i in range(len(theta)):
+        step = np.zeros(len(theta))
+        step[i] = h
+        assert np.isclose(grad[i], (logl(theta + step)[0]
+                                    - logl(theta - step)[0]) / 2 / h,
+                          rtol=1e-4, atol=1e-4)
+
+
+def test_joint_likelihood():
+    """
+    Test that JointLikelihood sums the datasets' likelihoods, gradients and
+    derived parameters, serially and on threads.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    theta = rng.uniform(-1, 1, 2 * N_max - 1)
+    theta[0] = 4.5
+    theta[2:-1:2] = np.sort(rng.uniform(x_min, x_max, N_max - 2))
+    likelihoods = [
+        Likelihood(x_min, x_max, rng.uniform(0, 0.5, 20),
+                   rng.normal(size=20), 0.5, adaptive=True,
+                   derived_x=[0.1, 0.2]),
+        Likelihood(x_min, x_max, rng.uniform(0.3, 1, 40),
+                   rng.normal(size=40), rng.uniform(0.1, 1, (2, 40)),
+                   adaptive=True),
+        Likelihood(x_min, x_max, rng.uniform(0, 1, 30),
+                   rng.normal(size=30), 0.2, adaptive=True,
+                   sufficient_statistics=True, derived_slopes=[0.5]),
+    ]
+    logL = sum(likelihood(theta)[0] for likelihood in likelihoods)
+    gradient = sum(likelihood.value_and_grad(theta)[1]
+                   for likelihood in likelihoods)
+    derived = np.concatenate((likelihoods[0](theta)[1],
+                              likelihoods[2](theta)[1]))
+    thetas = np.array([theta, theta * 0.9])
+    for threads in [None, 3]:
+        with JointLikelihood(likelihoods, threads=threads) as joint:
+            assert joint.n_derived == 3
+            assert np.isclose(joint(theta)[0], logL)
+            assert np.allclose(joint(theta)[1], derived)
+            assert np.isclose(joint.value_and_grad(theta)[0], logL)
+            assert np.allclose(joint.value_and_grad(theta)[1], gradient)
+            assert np.allclose(joint.batch(thetas),
+                               sum(likelihood.batch(thetas)
+                                   for likelihood in likelihoods))
+
+    with pytest.raises(ValueError):
+        JointLikelihood([likelihoods[0],
+                         Likelihood(x_min, 2, [0.5], [0], 1, adaptive=True)])
+
+
+def test_likelihood_workspace():
+    """
+    Test that the sigma_x workspace is reused once it is large enough, with
+    the same results, and that it is not pickled with its contents.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 6
+    x_data = rng.uniform(x_min, x_max, 100)
+    y_data = rng.normal(size=100)
+    sigma = rng.uniform(0.05, 0.5, (2, 100))
+    thetas = rng.uniform(-1, 1, (5, 2 * N_max - 1))
+    thetas[:, 0] = [2.5, 6.5, 3.5, 6.5, 1.5]
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (5, N_max - 2)))
+    expected = Likelihood(x_min, x_max, x_data, y_data, sigma,
+                          adaptive=True).batch(thetas)
+
+    layout = ThetaLayout(0, N_max, adaptive=True)
+    for kwargs in [{}, {"layout": layout}, {"chunk_size": 30},
+                   {"truncate": 5, "layout": layout}]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True,
+                          **kwargs)
+        workspace = logl._likelihood_function.workspace
+        if "layout" in kwargs and "truncate" not in kwargs:
+            assert workspace.size == 100 * (N_max - 1)
+        else:
+            assert workspace.size == 0
+        assert np.allclose([logl(theta)[0] for theta in thetas], expected)
+        buffers = [buffer.ctypes.data for buffer in workspace.buffers((1, 1))]
+        assert np.allclose([logl(theta)[0] for theta in thetas], expected)
+        assert buffers == [buffer.ctypes.data
+                           for buffer in workspace.buffers((1, 1))]
+
+        logl = pickle.loads(pickle.dumps(logl))
+        assert np.allclose([logl(theta)[0] for theta in thetas], expected)
+
+
+def test_likelihood_threads():
+    """
+    Test that one sigma_x likelihood called from several threads at once
+    gives the same results as calling it serially.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 6
+    x_data = rng.uniform(x_min, x_max, 2000)
+    y_data = rng.normal(size=2000)
+    thetas = rng.uniform(-1, 1, (64, 2 * N_max - 1))
+    thetas[:, 0] = rng.uniform(2, N_max + 1, 64)
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (64, N_max - 2)))
+    for kwargs in [{}, {"layout": ThetaLayout(0, N_max, adaptive=True)}]:
+        logl = Likelihood(x_min, x_max, x_data, y_data,
+                          np.array([0.05, 0.5]), adaptive=True, **kwargs)
+        serial = [logl(theta)[0] for theta in thetas]
+        with ThreadPoolExecutor(8) as executor:
+            threaded = list(executor.map(lambda theta: logl(theta)[0],
+                                         thetas))
+        assert np.array_equal(serial, threaded)
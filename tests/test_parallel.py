@@ -0,0 +1,62 @@
+"""Test that the parallel and sharded likelihoods match Likelihood."""
+
+import numpy as np
+import pytest
+from flexknot import Likelihood
+from flexknot.parallel import ParallelLikelihood, ShardedLikelihood
+
+rng = np.random.default_rng()
+x_min, x_max = 0, 1
+N_max = 5
+x_data = rng.uniform(x_min, x_max, 50)
+y_data = rng.normal(size=50)
+thetas = rng.uniform(-1, 1, (20, 2 * N_max - 1))
+thetas[:, 0] = rng.uniform(0, N_max + 1, 20)
+thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max, (20, N_max - 2)))
+
+
+def test_parallel_likelihood():
+    """
+    Test that ParallelLikelihood gives the same results as Likelihood.batch,
+    however the thetas are split into blocks.
+    """
+    for sigma in [0.5, rng.uniform(0.1, 1, (2, 50))]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True)
+        with ParallelLikelihood(x_min, x_max, x_data, y_data, sigma,
+                                adaptive=True, processes=2) as parallel:
+            assert np.allclose(logl.batch(thetas), parallel.batch(thetas))
+            assert np.allclose(logl.batch(thetas),
+                               parallel.batch(thetas, block_size=3))
+            # blocks of two thetas' worth of data
+            assert np.allclose(logl.batch(thetas),
+                               parallel.batch(thetas, max_memory=800))
+
+
+def test_sharded_likelihood():
+    """
+    Test that summing over shards of the data gives the same results as
+    Likelihood, including the normalisation.
+    """
+    for sigma in [0.5, rng.uniform(0.1, 1, 50), np.array([0.1, 0.5]),
+                  rng.uniform(0.1, 1, (2, 50))]:
+        logl = Likelihood(x_min, x_max, x_data, y_data, sigma, adaptive=True)
+        with ShardedLikelihood(x_min, x_max, x_data, y_data, sigma,
+                               adaptive=True, n_shards=3) as sharded:
+            assert np.isclose(logl(thetas[0])[0], sharded(thetas[0])[0])
+            assert np.allclose(logl.batch(thetas), sharded.batch(thetas))
+
+
+def test_sharded_likelihood_exception():
+    """
+    Test that an exception in the workers is raised in the parent, and that
+    the shards still answer later calls and close cleanly.
+    """
+    logl = Likelihood(x_min, x_max, x_data, y_data, 0.5, adaptive=True)
+    with ShardedLikelihood(x_min, x_max, x_data, y_data, 0.5,
+                           adaptive=True, n_shards=3) as sharded:
+        with pytest.raises(ValueError):
+            sharded(thetas[0, :-1])
+        with pytest.raises(ValueError):
+            sharded.batch(thetas[:, :-1])
+        assert np.isclose(logl(thetas[0])[0], sharded(thetas[0])[0])
+        assert np.allclose(logl.batch(thetas), sharded.batch(thetas))
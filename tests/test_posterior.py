@@ -0,0 +1,47 @@
+"""Test the streaming functional posterior against the full matrix."""
+
+import numpy as np
+from flexknot import AdaptiveKnot
+from flexknot.posterior import functional_posterior
+
+
+def test_functional_posterior():
+    """
+    Test that the streamed quantiles, mean and standard deviation match
+    those of the full (n_samples, n_grid) matrix.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_max = 5
+    n_samples = 2000
+    thetas = rng.uniform(-1, 1, (n_samples, 2 * N_max - 1))
+    thetas[:, 0] = rng.uniform(2, N_max + 1, n_samples)
+    thetas[:, 2:-1:2] = np.sort(rng.uniform(x_min, x_max,
+                                            (n_samples, N_max - 2)))
+    weights = rng.uniform(0, 1, n_samples)
+    flexknot = AdaptiveKnot(x_min, x_max)
+    x = np.linspace(x_min, x_max, 50)
+    bins = 1000
+
+    posterior = functional_posterior(flexknot, x, zip(thetas, weights),
+                                     -1, 1, bins=bins, chunk_size=300)
+
+    f = flexknot.batch(x, thetas)
+    assert np.isclose(posterior.total_weight, weights.sum())
+    assert np.allclose(posterior.mean(), np.average(f, axis=0,
+                                                    weights=weights))
+    assert np.allclose(
+        posterior.std(),
+        np.sqrt(np.cov(f, rowvar=False, aweights=weights, bias=True)
+                .diagonal()),
+    )
+    assert not np.any(posterior.outside)
+
+    q = [0.025, 0.5, 0.975]
+    order = np.argsort(f, axis=0)
+    cdf = np.cumsum(weights[order], axis=0) / weights.sum()
+    for i, q_i in enumerate(q):
+        k = np.argmax(cdf >= q_i, axis=0)
+        expected = np.take_along_axis(f, order, axis=0)[k, np.arange(len(x))]
+        # within a bin width, plus the gap between neighbouring samples
+        assert np.all(np.abs(posterior.quantiles(q)[i] - expected) < 0.02)
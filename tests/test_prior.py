@@ -2,9 +2,13 @@
 Test that flexknot.Prior sorts the x nodes.
 """
 
+import pickle
+import subprocess
+import sys
 import numpy as np
 from flexknot import AdaptivePrior, Prior
-from flexknot.utils import get_x_nodes_from_theta
+from flexknot.priors import SortedUniformPrior, UniformPrior
+from flexknot.utils import ThetaLayout, get_x_nodes_from_theta
 
 rng = np.random.default_rng()
 x_min = 0
@@ -36,3 +40,82 @@ def test_adaptiveknotprior_x_nodes_are_sorted():
     )(hypercube)
 
     assert np.all(np.diff(get_x_nodes_from_theta(prior, adaptive=True)) >= 0)
+
+
+def test_adaptiveknotprior_layout():
+    """
+    Test that the adaptive prior gives the same theta with a ThetaLayout.
+    """
+    hypercube = rng.random(2 * N_max - 1)
+    layout = ThetaLayout(N_min, N_max, adaptive=True)
+    assert np.all(
+        AdaptivePrior(x_min, x_max, y_min, y_max, N_min, N_max)(hypercube)
+        == AdaptivePrior(x_min, x_max, y_min, y_max, N_min, N_max,
+                         layout=layout)(hypercube)
+    )
+
+
+def test_flexknotprior_batch():
+    """
+    Test that Prior.batch agrees with transforming each hypercube in turn.
+    """
+    hypercubes = rng.random((20, 2 * N_max - 2))
+    prior = Prior(x_min, x_max, y_min, y_max)
+    assert np.allclose(prior.batch(hypercubes),
+                       np.array([prior(hypercube)
+                                 for hypercube in hypercubes]))
+
+
+def test_adaptiveknotprior_batch():
+    """
+    Test that AdaptivePrior.batch agrees with transforming each hypercube
+    in turn, and that the used x nodes of every row are sorted.
+    """
+    hypercubes = rng.random((100, 2 * N_max - 1))
+    prior = AdaptivePrior(x_min, x_max, y_min, y_max, N_min, N_max)
+    thetas = prior.batch(hypercubes)
+    assert np.allclose(thetas, np.array([prior(hypercube)
+                                         for hypercube in hypercubes]))
+    for theta in thetas:
+        assert np.all(np.diff(get_x_nodes_from_theta(theta, adaptive=True))
+                      >= 0)
+
+
+def test_prior_pickle():
+    """
+    Test that priors survive a round trip through pickle.
+    """
+    hypercube = rng.random(2 * N_max - 1)
+    prior = AdaptivePrior(x_min, x_max, y_min, y_max, N_min, N_max)
+    assert np.all(prior(hypercube)
+                  == pickle.loads(pickle.dumps(prior))(hypercube))
+    prior = Prior(x_min, x_max, y_min, y_max)
+    assert np.all(prior(hypercube[1:])
+                  == pickle.loads(pickle.dumps(prior))(hypercube[1:]))
+
+
+def test_uniform_priors():
+    """
+    Test the uniform and sorted uniform transforms against the forced
+    identifiability transform written out in full.
+    """
+    hypercube = rng.random(7)
+    assert np.allclose(UniformPrior(-2, 3)(hypercube), -2 + 5 * hypercube)
+
+    n = len(hypercube)
+    t = np.zeros(n)
+    t[-1] = hypercube[-1]**(1 / n)
+    for i in range(n - 2, -1, -1):
+        t[i] = hypercube[i]**(1 / (i + 1)) * t[i + 1]
+    assert np.allclose(SortedUniformPrior(-2, 3)(hypercube), -2 + 5 * t)
+
+
+def test_import_is_light():
+    """Test that importing flexknot does not load pypolychord or numba."""
+    modules = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, flexknot; print(' '.join(sys.modules))"],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    assert "pypolychord" not in modules
+    assert "numba" not in modules
@@ -0,0 +1,49 @@
+"""Test the opt-in instrumentation."""
+
+import numpy as np
+from flexknot import AdaptiveKnot, AdaptivePrior, Likelihood
+from flexknot.profiling import Stats
+
+
+def test_stats():
+    """
+    Test that a shared Stats counts the calls to each stage and floor(N),
+    and calls the hook, without changing any results.
+    """
+    rng = np.random.default_rng()
+    x_min, x_max = 0, 1
+    N_min, N_max = 0, 6
+    x_data = rng.uniform(x_min, x_max, 100)
+    y_data = rng.normal(size=100)
+    hooked = []
+    stats = Stats(hook=lambda stage, seconds: hooked.append(stage),
+                  max_samples=10)
+
+    prior = AdaptivePrior(x_min, x_max, -1, 1, N_min, N_max,
+                          instrument=stats)
+    flexknot = AdaptiveKnot(x_min, x_max, instrument=stats)
+    logl = Likelihood(x_min, x_max, x_data, y_data, 0.5, adaptive=True,
+                      derived_x=[0.5], instrument=stats)
+    plain = Likelihood(x_min, x_max, x_data, y_data, 0.5, adaptive=True,
+                       derived_x=[0.5])
+
+    n_calls = 20
+    Ns = []
+    for hypercube in rng.uniform(size=(n_calls, 2 * N_max - 1)):
+        theta = prior(hypercube)
+        Ns.append(int(theta[0]))
+        assert np.array_equal(flexknot(x_data, theta),
+                              AdaptiveKnot(x_min, x_max)(x_data, theta))
+        logL, derived = logl(theta)
+        assert logL == plain(theta)[0]
+        assert derived == plain(theta)[1]
+
+    for stage in ["prior", "flexknot", "likelihood", "nodes",
+                  "loglikelihood", "derived"]:
+        assert n_calls == stats.calls[stage] == hooked.count(stage)
+        assert 10 == len(stats._samples[stage])
+        summary = stats.summary()[stage]
+        assert 0 < summary["p50"] <= summary["p99"]
+    # counted once by the flex-knot, and once by the likelihood
+    assert stats.nodes == {N: 2 * Ns.count(N) for N in set(Ns)}
+    assert plain.stats is None
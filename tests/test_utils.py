@@ -2,6 +2,7 @@
 
 import numpy as np
 from flexknot.utils import (
+    ThetaLayout,
     create_theta,
     get_theta_n,
     get_x_nodes_from_theta,
@@ -55,3 +56,25 @@ def test_get_y_nodes_from_theta():
     Test that get_y_nodes_from_theta() extracts the y_nodes correctly.
     """
     assert np.all(y_nodes == get_y_nodes_from_theta(theta, adaptive=False))
+
+
+def test_theta_layout():
+    """
+    Test that ThetaLayout extracts the same nodes as get_x_nodes_from_theta
+    and get_y_nodes_from_theta, for every number of nodes.
+    """
+    N_max = 6
+    adaptive_theta = np.arange(2 * N_max - 1, dtype=float)
+    layout = ThetaLayout(0, N_max, adaptive=True)
+    for n in range(2, N_max + 1):
+        adaptive_theta[0] = n + 0.5
+        layout.validate(adaptive_theta)
+        assert np.all(layout.x_nodes(adaptive_theta)
+                      == get_x_nodes_from_theta(adaptive_theta, adaptive=True))
+        assert np.all(layout.y_nodes(adaptive_theta)
+                      == get_y_nodes_from_theta(adaptive_theta, adaptive=True))
+
+    layout = ThetaLayout(4, 4, adaptive=False)
+    layout.validate(theta)
+    assert np.all(x_nodes == layout.x_nodes(theta))
+    assert np.all(y_nodes == layout.y_nodes(theta))